@@ -25,7 +25,7 @@ class Logs:
                 self.status = f"Error in logging.py Logger.create_file(): {e}"
     
 
-    def basicConfig(self):
+    def basicConfig(self, force=False):
         try:
             if self.DEBUG != '0':
                 print("§§§§§§§§§§§§§§§§§§§§§§")
@@ -33,19 +33,27 @@ class Logs:
                 print("§§§§§§§§§§§§§§§§§§§§§§")
                 print("Debug mode: ", self.DEBUG)
                 if self.DEBUG == '1':
-                    logging.basicConfig(filename=self.log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+                    logging.basicConfig(filename=self.log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=force)
                 elif self.DEBUG == '2':
-                    logging.basicConfig(filename=self.log_filename, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+                    logging.basicConfig(filename=self.log_filename, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', force=force)
                 elif self.DEBUG == '3':
-                    logging.basicConfig(filename=self.log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+                    logging.basicConfig(filename=self.log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=force)
             
             else:
-                logging.basicConfig(filename=self.log_filename, level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+                logging.basicConfig(filename=self.log_filename, level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', force=force)
 
         except Exception as e:
             self.status = f"Error in logging.py Logger.basicConfig(): {e}"
 
 
+    def rotate(self):
+        # resident process (daemon): a new log file each day, the old ones are cleaned up
+        if self.log_filename != f"{self.LOGS_PATH}{datetime.now().strftime('%Y-%m-%d')}.log":
+            self.create_file()
+            if not self.status: self.basicConfig(force=True)
+            if not self.status: self.cleanup_log()
+
+
     def cleanup_log(self):
         retention_days = int(os.getenv('LOG_RETENTION_DAYS', '30'))
         self.logging_msg(f"retention_days: '{retention_days}'", 'DEBUG')
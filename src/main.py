@@ -1,32 +1,110 @@
+import argparse
 import dotenv
+import os
 from src.logs import Logs
 from src.utils_sqlite import PodcastDB
-from src.utils_parse_rss import ParseRSS
-from src.utils_podcast import Podcasts
+from src.utils_http import HttpClient
 
 
 dotenv.load_dotenv(override=True)
 
+STAGES = ('parse', 'download', 'transcribe', 'summarize')
 
-def main()->bool:
+
+def pending(podcastdb, stage)->int:
+    # episodes waiting for a stage, with the failed ones tried again (same filters as the stages of Podcasts)
+    filters = {
+        'download': [{'downloaded': False}, {'downloaded': (2, 3)} if os.getenv("DOWNLOAD_RETRY_FAILED", '1') == '1' else None],
+        'transcribe': [{'downloaded': True, 'transcribed': False}, {'downloaded': True, 'transcribed': (2, 3)} if os.getenv("WHISPER_RETRY_FAILED", '1') == '1' else None],
+        'summarize': [
+            {'downloaded': True, 'transcribed': True, 'summarized': False},
+            {'downloaded': True, 'transcribed': True, 'summarized': (2,)} if os.getenv("OPENAI_RETRY_FAILED", '1') == '1' else None,
+            {'summarized': (4,)} if os.getenv("OPENAI_BATCH", '0') == '1' else None, # batches to reconcile
+        ],
+    }[stage]
+    return sum(podcastdb.count_podcasts(**stage_filters) for stage_filters in filters if stage_filters)
+
+
+def load_podcasts(logs, podcastdb, http):
+    from src.utils_podcast import Podcasts
+    return Podcasts(logs, podcastdb, http)
+
+
+def main(stages=('all',))->bool:
     logs = Logs()
     podcastdb = PodcastDB(logs)
+    # no connection before the first request
+    http = HttpClient(logs)
 
     if not logs.status and not podcastdb.status:
         logs.logging_msg("START PROGRAM", "WARNING")
 
-        logs.logging_msg("parsing RSS feeds")
-        ParseRSS(logs, podcastdb)
+        stages = list(STAGES) if 'all' in stages else [stage for stage in STAGES if stage in stages]
+        # daemon mode: resident process, the connections, HTTP pools, prompts and link index stay warm between the cycles
+        daemon = None
+        if os.getenv("DAEMON", '0') == '1':
+            from src.utils_daemon import Daemon
+            daemon = Daemon(logs)
+        podcasts = None
+        parserss = None
+        force = False
+
+        try:
+            while True:
+                if 'parse' in stages:
+                    logs.logging_msg("parsing RSS feeds")
+                    if parserss is None:
+                        from src.utils_parse_rss import ParseRSS
+                        parserss = ParseRSS(logs, podcastdb, http)
+                    else:
+                        parserss.parse_feeds(force)
+
+                # the stages (openai, bs4, Whisper...) are only loaded when an episode is waiting for them
+                if os.getenv("PIPELINE_MODE", 'stages') == 'overlap' and len(stages) == len(STAGES):
+                    if any(pending(podcastdb, stage) for stage in STAGES[1:]):
+                        from src.utils_pipeline import Pipeline
+                        podcasts = podcasts or load_podcasts(logs, podcastdb, http)
+                        logs.logging_msg("download, transcribe and summarize podcasts (overlapped pipeline)")
+                        Pipeline(logs, podcastdb, podcasts).run()
+
+                else:
+                    # checked before each stage: the episodes of the previous stage are waiting for the next one
+                    for stage in [stage for stage in stages if stage != 'parse']:
+                        if not pending(podcastdb, stage):
+                            logs.logging_msg(f"no podcast to {stage}", 'DEBUG')
+                            continue
+                        podcasts = podcasts or load_podcasts(logs, podcastdb, http)
+                        logs.logging_msg(f"{stage} podcasts")
+                        getattr(podcasts, f'{stage}_podcasts')()
+
+                if daemon is None:
+                    break
+
+                # the feeds are polled again when the next one is due, or at once on POST /poll
+                delay = parserss.scheduler.sleep_time(parserss.feeds) if parserss else daemon.DAEMON_IDLE_SECONDS
+                logs.logging_msg(f"next cycle in {delay / 60:.0f} min")
+                if not daemon.wait(delay):
+                    break
 
-        logs.logging_msg("download podcasts")
-        podcasts = Podcasts(logs, podcastdb)
-        podcasts.download_podcasts()
+                logs.rotate()
+                force = daemon.take_poll()
+                if daemon.take_reload():
+                    logs.logging_msg("reload the configuration", "WARNING")
+                    dotenv.load_dotenv(override=True)
+                    if parserss:
+                        parserss.reload()
+                    if podcasts:
+                        podcasts.reload()
 
-        logs.logging_msg("transcribe podcasts")
-        podcasts.transcribe_podcasts()
+        except KeyboardInterrupt:
+            logs.logging_msg("interrupted", "WARNING")
 
-        logs.logging_msg("summarize podcasts")
-        podcasts.summarize_podcasts()
+        if daemon:
+            daemon.close()
+        if podcasts:
+            podcasts.close()
+        http.log_stats()
+        http.close()
 
         logs.logging_msg("logout from podcastdb")
         podcastdb.logout()
@@ -42,4 +120,6 @@ def main()->bool:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Watch podcasts: parse the RSS feeds, download, transcribe and summarize the episodes.")
+    parser.add_argument('stages', nargs='*', choices=STAGES + ('all',), default=['all'], help="stages to run (default: all)")
+    main(parser.parse_args().stages)
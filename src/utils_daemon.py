@@ -0,0 +1,147 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
+import threading
+import signal
+import json
+import os
+
+
+######################################################################################################################################################
+class Daemon():
+    def __init__(self, logs):
+        self.logs = logs
+
+        self.DAEMON_HOST = os.getenv("DAEMON_HOST", '127.0.0.1')
+        self.DAEMON_PORT = int(os.getenv("DAEMON_PORT", '8765'))
+        self.DAEMON_IDLE_SECONDS = float(os.getenv("DAEMON_IDLE_SECONDS", '3600')) # between two cycles without the 'parse' stage
+
+        # requests of the signals and of the local endpoint, handled by the main loop between two cycles
+        self.wake = threading.Event()
+        self.stopping = False
+        self.reloading = False
+        self.polling = False
+        self.cycles = 0
+        self.last_cycle = None
+        self.next_cycle = None
+
+        # the handlers can only be set in the main thread
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            if hasattr(signal, 'SIGHUP'):
+                signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+
+        self.server = None
+        if self.DAEMON_PORT > 0:
+            self.serve()
+
+
+    def serve(self):
+        prefix = f'[{self.__class__.__name__} | serve]'
+
+        # port already in use: the daemon runs without its endpoint (signals only)
+        try:
+            self.server = ThreadingHTTPServer((self.DAEMON_HOST, self.DAEMON_PORT), DaemonHandler)
+            self.server.daemon_threads = True
+            self.server.manager = self
+            threading.Thread(target=self.server.serve_forever, name='daemon-http', daemon=True).start()
+            self.logs.logging_msg(f"{prefix} listening on http://{self.DAEMON_HOST}:{self.server.server_port}/", 'DEBUG')
+
+        except OSError as e:
+            self.server = None
+            self.logs.logging_msg(f"{prefix} no endpoint on {self.DAEMON_HOST}:{self.DAEMON_PORT}: {e}", 'ERROR')
+
+
+    def poll(self):
+        # "poll now": all the feeds, due or not
+        self.polling = True
+        self.wake.set()
+
+
+    def reload(self):
+        self.reloading = True
+        self.wake.set()
+
+
+    def stop(self):
+        self.stopping = True
+        self.wake.set()
+
+
+    def wait(self, delay)->bool:
+        # sleep until the next feed is due or until a request, False: stop
+        self.cycles += 1
+        self.last_cycle = datetime.now().isoformat(timespec='seconds')
+        self.next_cycle = (datetime.now() + timedelta(seconds=delay)).isoformat(timespec='seconds')
+
+        self.wake.wait(delay)
+        self.wake.clear()
+        self.next_cycle = None
+        return not self.stopping
+
+
+    def take_poll(self)->bool:
+        polling, self.polling = self.polling, False
+        return polling
+
+
+    def take_reload(self)->bool:
+        reloading, self.reloading = self.reloading, False
+        return reloading
+
+
+    def status(self)->dict:
+        return {
+            'cycles': self.cycles,
+            'last_cycle': self.last_cycle,
+            'next_cycle': self.next_cycle,
+            'stopping': self.stopping
+        }
+
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+######################################################################################################################################################
+class DaemonHandler(BaseHTTPRequestHandler):
+    # POST /poll, POST /reload, POST /stop, GET /status
+    def do_POST(self):
+        if self.from_browser():
+            return
+        daemon = self.server.manager
+        actions = {'/poll': daemon.poll, '/reload': daemon.reload, '/stop': daemon.stop}
+        if self.path not in actions:
+            return self.answer(404, {'error': f'unknown action: {self.path}'})
+        actions[self.path]()
+        self.answer(202, {'accepted': self.path.strip('/')})
+
+
+    def do_GET(self):
+        if self.from_browser():
+            return
+        if self.path != '/status':
+            return self.answer(404, {'error': f'unknown path: {self.path}'})
+        self.answer(200, self.server.manager.status())
+
+
+    def from_browser(self)->bool:
+        # curl, scripts and cron send no Origin: a request of a web page (cross-origin form post) is refused
+        if self.headers.get('Origin') is None:
+            return False
+        self.answer(403, {'error': 'requests from a browser page are not accepted'})
+        return True
+
+
+    def answer(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def log_message(self, format, *args):
+        self.server.manager.logs.logging_msg(f"[{self.__class__.__name__}] {self.address_string()} {format % args}", 'DEBUG')
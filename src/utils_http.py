@@ -0,0 +1,127 @@
+import threading
+import os
+
+
+######################################################################################################################################################
+class HttpClient:
+    def __init__(self, logs):
+        self.logs = logs
+
+        self.HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", '10'))
+        self.HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", '10'))
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", '30'))
+        self.HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", '3'))
+        self.HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", '0.5'))
+
+        # the session (and `requests`) is only loaded by the first request: no cost for the runs without network
+        self.connect_lock = threading.Lock()
+        self._session = None
+        self.adapter = None
+
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self.connect_lock:
+                if self._session is None:
+                    self._session = self.connect()
+        return self._session
+
+
+    def connect(self):
+        from urllib3.util.retry import Retry
+        import requests
+
+        session = requests.Session()
+        # only idempotent requests are retried: a POST to Whisper is never sent twice by the pool
+        retry = Retry(
+            total=self.HTTP_RETRIES,
+            backoff_factor=self.HTTP_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.adapter = pooled_adapter()(
+            pool_connections=self.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            max_retries=retry
+        )
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        return session
+
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.HTTP_TIMEOUT)
+        return self.session.request(method, url, **kwargs)
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+    def stats(self)->dict:
+        requests_count = self.adapter.requests if self.adapter else 0
+        connections_count = self.adapter.connections if self.adapter else 0
+
+        # each request reuses a kept-alive connection (hit) or opens a new one (miss)
+        misses = min(connections_count, requests_count)
+        return {
+            'requests': requests_count,
+            'hits': requests_count - misses,
+            'misses': misses,
+            'hit_rate': (requests_count - misses) / requests_count if requests_count else 0.0
+        }
+
+
+    def log_stats(self):
+        prefix = f'[{self.__class__.__name__} | log_stats]'
+
+        stats = self.stats()
+        self.logs.logging_msg(f"{prefix} {stats['requests']} requests, pool hits: {stats['hits']}, pool misses: {stats['misses']}, hit rate: {stats['hit_rate']:.0%}")
+
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+def pooled_adapter():
+    # HTTPAdapter counting the requests sent and the connections opened for them, defined with the first session
+    from requests.adapters import HTTPAdapter
+    import weakref
+
+    class PooledAdapter(HTTPAdapter):
+        def __init__(self, *args, **kwargs):
+            self.stats_lock = threading.Lock()
+            self.requests = 0
+            self.connections = 0
+            # connections already counted by pool, the pools closed by the pool manager are forgotten
+            self.counted = weakref.WeakKeyDictionary()
+            self.current = threading.local()
+            super().__init__(*args, **kwargs)
+
+
+        def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+            pool = super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+            self.current.pool = pool
+            return pool
+
+
+        def send(self, request, **kwargs):
+            self.current.pool = None
+            try:
+                return super().send(request, **kwargs)
+            finally:
+                pool = self.current.pool
+                if pool is not None:
+                    with self.stats_lock:
+                        self.requests += 1
+                        self.connections += pool.num_connections - self.counted.get(pool, 0)
+                        self.counted[pool] = pool.num_connections
+
+    return PooledAdapter
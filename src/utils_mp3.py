@@ -0,0 +1,110 @@
+from array import array
+import mmap
+import os
+
+
+# MPEG audio frame header tables (index: bits of the header)
+BITRATES = {
+    # (version 1, layer III / II)
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 0],
+    # (version 2 and 2.5, layer III / II)
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+SAMPLE_RATES = {
+    1: [44100, 48000, 32000, 0],
+    2: [22050, 24000, 16000, 0],
+    25: [11025, 12000, 8000, 0],
+}
+
+
+######################################################################################################################################################
+class MP3Splitter:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # offset of the first frame starting after each second of audio: the audio is cut on frame boundaries
+        self.seconds = array('q')
+        self.duration = 0.0
+        self.size = 0
+
+
+    def frame(self, data, offset)->tuple:
+        # (frame length in bytes, duration in seconds) of a valid frame header at offset, else None
+        if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+            return None
+
+        version = {3: 1, 2: 2, 0: 25}.get((data[offset + 1] >> 3) & 0x03)
+        layer = {1: 3, 2: 2}.get((data[offset + 1] >> 1) & 0x03)
+        if version is None or layer is None:
+            return None
+
+        bitrate = BITRATES[(1 if version == 1 else 2, layer)][data[offset + 2] >> 4] * 1000
+        sample_rate = SAMPLE_RATES[version][(data[offset + 2] >> 2) & 0x03]
+        padding = (data[offset + 2] >> 1) & 0x01
+        if not bitrate or not sample_rate:
+            return None
+
+        samples = 576 if version != 1 and layer == 3 else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+        return length, samples / sample_rate
+
+
+    def scan(self)->float:
+        self.size = os.path.getsize(self.file_path)
+        self.seconds = array('q')
+        self.duration = 0.0
+
+        with open(self.file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            # ID3v2 tag at the beginning of the file
+            if data[:3] == b'ID3' and len(data) >= 10:
+                offset = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+
+            while offset < len(data):
+                frame = self.frame(data, offset)
+                if frame is None:
+                    # lost sync (junk, ID3v1 tag...): next frame header
+                    offset = data.find(b'\xff', offset + 1)
+                    if offset == -1:
+                        break
+                    continue
+
+                while len(self.seconds) <= self.duration:
+                    self.seconds.append(offset)
+                self.duration += frame[1]
+                offset += frame[0]
+
+        return self.duration
+
+
+    def offset(self, second)->int:
+        # end of the audio: the end of the file, the frames of its last second included
+        if second >= self.duration or second >= len(self.seconds):
+            return self.size
+        return self.seconds[int(second)]
+
+
+    def segments(self, segment_seconds, overlap_seconds)->list:
+        # [(start, end)] in seconds, each segment overlaps the previous one
+        segments = []
+        start = 0
+        step = max(segment_seconds - overlap_seconds, 1)
+        while True:
+            end = min(start + segment_seconds, self.duration)
+            segments.append((start, end))
+            if end >= self.duration:
+                return segments
+            start += step
+
+
+    def write(self, start, end, file_path):
+        with open(self.file_path, 'rb') as source, open(file_path, 'wb') as target:
+            source.seek(self.offset(start))
+            remaining = self.offset(end) - self.offset(start)
+            while remaining > 0:
+                chunk = source.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                target.write(chunk)
+                remaining -= len(chunk)
@@ -0,0 +1,436 @@
+from string import Template
+import openai
+import requests
+import hashlib
+import random
+import json
+import threading
+import time
+import os
+try:
+    import tiktoken
+except ImportError: # optional: the tokens are estimated from the length of the texts
+    tiktoken = None
+
+
+# default prompt of the chunks of the long transcriptions (map-reduce summaries)
+CHUNK_PROMPT = "Summarize this part of a podcast transcription. Keep all the topics, facts, names and figures, they will be merged with the summaries of the other parts."
+
+
+######################################################################################################################################################
+class OpenAIClient:
+    # errors worth a new attempt: rate limit, overloaded or unreachable API
+    # the other ones (key, permissions, request too big...) would fail again and are raised at once
+    RETRY_ERRORS = (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIConnectionError,
+        openai.error.Timeout,
+        openai.error.TryAgain,
+        openai.error.APIError,
+    )
+
+    # states of a batch after which it does not change anymore
+    BATCH_DONE = ('completed', 'failed', 'expired', 'cancelled')
+
+    def __init__(self, logs, api_key, cache=None, http=None):
+        self.logs = logs
+        self.api_key = api_key
+        self.cache = cache
+        self.http = http if http else requests
+
+        self.OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", 'https://api.openai.com/v1')
+        self.OPENAI_MODEL = os.getenv("OPENAI_MODEL", 'gpt-4o')
+        self.OPENAI_WORKERS = int(os.getenv("OPENAI_WORKERS", '4'))
+        self.OPENAI_RPM = int(os.getenv("OPENAI_RPM", '500'))
+        self.OPENAI_TPM = int(os.getenv("OPENAI_TPM", '30000'))
+        self.OPENAI_COMPLETION_TOKENS = int(os.getenv("OPENAI_COMPLETION_TOKENS", '1000'))
+        self.OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", '5'))
+        self.OPENAI_BACKOFF = float(os.getenv("OPENAI_BACKOFF", '1'))
+        self.OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", '60'))
+        self.OPENAI_CHUNK_TOKENS = int(os.getenv("OPENAI_CHUNK_TOKENS", '16000'))
+        self.OPENAI_PRICE_INPUT = float(os.getenv("OPENAI_PRICE_INPUT", '2.5'))
+        self.OPENAI_PRICE_OUTPUT = float(os.getenv("OPENAI_PRICE_OUTPUT", '10'))
+        self.OPENAI_BATCH_MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", '1000'))
+        self.OPENAI_BATCH_PRICE_FACTOR = float(os.getenv("OPENAI_BATCH_PRICE_FACTOR", '0.5'))
+
+        # the two limits of the API tier, shared by all the summarization workers
+        self.requests_limiter = RateLimiter(self.OPENAI_RPM)
+        self.tokens_limiter = RateLimiter(self.OPENAI_TPM)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.tokens = 0
+        self.spent = 0.0
+
+        self.encoding = self.load_encoding()
+
+
+    def load_encoding(self):
+        if tiktoken is None:
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(self.OPENAI_MODEL)
+            except KeyError: # model unknown by this version of tiktoken
+                return tiktoken.get_encoding('o200k_base')
+
+        except Exception as e: # the encodings are downloaded at the first use
+            self.logs.logging_msg(f"tiktoken encoding not available, the tokens are estimated: {e}", 'WARNING')
+            return None
+
+
+    def count_tokens(self, text)->int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # about 4 characters per token
+        return len(text) // 4 + 1
+
+
+    def split(self, text, size)->list:
+        # chunks of about `size` tokens, cut between two words when the tokens are estimated
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return [self.encoding.decode(tokens[start:start + size]) for start in range(0, len(tokens), size)]
+
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = start + size * 4
+            if end < len(text):
+                space = text.rfind(' ', start, end)
+                end = space + 1 if space > start else end
+            chunks.append(text[start:end])
+            start = end
+        return chunks
+
+
+    def cost(self, usage, factor=1.0)->float:
+        # prices in $ per million tokens
+        return (usage['prompt_tokens'] * self.OPENAI_PRICE_INPUT + usage['completion_tokens'] * self.OPENAI_PRICE_OUTPUT) * factor / 1_000_000
+
+
+    def billed_cost(self, usages, factor=1.0)->float:
+        # cost of the requests sent on this run, the answers of the summary cache are free
+        return sum(self.cost(usage, factor) for usage in usages if not usage.get('cached'))
+
+
+    def chat(self, role, prompt)->tuple:
+        prefix = f'[{self.__class__.__name__} | chat]'
+
+        # returns (answer, {'prompt_tokens', 'completion_tokens'})
+        if self.cache:
+            key = self.cache.key(self.OPENAI_MODEL, role, prompt)
+            cached = self.cache.get(key)
+            if cached:
+                return cached
+
+        prompt_tokens = self.count_tokens(role) + self.count_tokens(prompt)
+        estimate = prompt_tokens + self.OPENAI_COMPLETION_TOKENS
+        for attempt in range(self.OPENAI_RETRIES + 1):
+            self.requests_limiter.consume(1)
+            self.tokens_limiter.consume(estimate)
+
+            try:
+                with self.lock:
+                    self.requests += 1
+                response = openai.ChatCompletion.create(
+                    api_key=self.api_key,
+                    api_base=self.OPENAI_BASE_URL,
+                    model=self.OPENAI_MODEL,
+                    messages=[
+                        {"role": "system", "content": role},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+
+                # the estimate is replaced by the real usage
+                content = response['choices'][0]['message']['content']
+                usage = response.get('usage', {})
+                usage = {
+                    'prompt_tokens': usage.get('prompt_tokens', prompt_tokens),
+                    'completion_tokens': usage.get('completion_tokens', self.count_tokens(content)),
+                }
+                used = usage['prompt_tokens'] + usage['completion_tokens']
+                self.tokens_limiter.consume(used - estimate, block=False)
+                with self.lock:
+                    self.tokens += used
+                    self.spent += self.cost(usage)
+
+                if self.cache:
+                    self.cache.put(key, content, usage)
+                return content, usage
+
+            except self.RETRY_ERRORS as e:
+                if attempt == self.OPENAI_RETRIES:
+                    raise
+
+                delay = self.backoff(attempt, e)
+                with self.lock:
+                    self.retries += 1
+                    if isinstance(e, openai.error.RateLimitError):
+                        self.rate_limited += 1
+                self.logs.logging_msg(f"{prefix} {e.__class__.__name__}, attempt {attempt + 1}/{self.OPENAI_RETRIES}, retry in {delay:.1f}s: {e}", 'WARNING')
+                time.sleep(delay)
+
+
+    def batch_request(self, custom_id, role, prompt)->dict:
+        # one line of the input file of a batch
+        return {
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': self.OPENAI_MODEL,
+                'messages': [
+                    {"role": "system", "content": role},
+                    {"role": "user", "content": prompt}
+                ]
+            }
+        }
+
+
+    def batch_api(self, method, path, **kwargs)->requests.Response:
+        # the Batch API is not in the openai 0.28 module: plain HTTP requests
+        response = self.http.request(method, f"{self.OPENAI_BASE_URL}{path}", headers={'Authorization': f'Bearer {self.api_key}'}, **kwargs)
+        response.raise_for_status()
+        return response
+
+
+    def submit_batch(self, batch_requests)->dict:
+        # upload of the JSONL input file, then creation of the batch
+        content = '\n'.join(json.dumps(request) for request in batch_requests).encode('utf-8')
+        input_file = self.batch_api('POST', '/files', data={'purpose': 'batch'}, files={'file': ('summaries.jsonl', content, 'application/jsonl')}).json()
+        return self.batch_api('POST', '/batches', json={
+            'input_file_id': input_file['id'],
+            'endpoint': '/v1/chat/completions',
+            'completion_window': '24h'
+        }).json()
+
+
+    def retrieve_batch(self, batch_id)->dict:
+        return self.batch_api('GET', f'/batches/{batch_id}').json()
+
+
+    def batch_results(self, file_id)->dict:
+        # {custom_id: (answer, usage) or None when the request failed}
+        results = {}
+        for line in self.batch_api('GET', f'/files/{file_id}/content').text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get('response') or {}
+            if response.get('status_code') == 200:
+                body = response['body']
+                usage = body.get('usage', {})
+                results[result['custom_id']] = (body['choices'][0]['message']['content'], {
+                    'prompt_tokens': usage.get('prompt_tokens', 0),
+                    'completion_tokens': usage.get('completion_tokens', 0),
+                })
+            else:
+                results[result['custom_id']] = None
+        return results
+
+
+    def backoff(self, attempt, error=None)->float:
+        # exponential backoff with jitter: the workers limited at the same time do not retry at the same time
+        delay = min(self.OPENAI_BACKOFF * 2 ** attempt, self.OPENAI_BACKOFF_MAX)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+
+        headers = getattr(error, 'headers', None) or {}
+        try:
+            delay = max(delay, float(headers.get('retry-after', 0)))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+
+    def log_stats(self):
+        prefix = f'[{self.__class__.__name__} | log_stats]'
+
+        self.logs.logging_msg(f"{prefix} {self.requests} requests, {self.retries} retries ({self.rate_limited} rate limited), {self.tokens} tokens, ${self.spent:.4f}")
+
+
+######################################################################################################################################################
+class RateLimiter():
+    def __init__(self, rate_per_minute):
+        # token bucket refilled continuously, up to one minute of the limit
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.allowance = rate_per_minute
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def consume(self, amount, block=True):
+        # a negative amount gives back the tokens reserved but not used
+        if self.rate <= 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.capacity, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= amount
+            wait = -self.allowance / self.rate if self.allowance < 0 and block else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+######################################################################################################################################################
+class SummaryCache():
+    def __init__(self, logs, podcastdb):
+        self.logs = logs
+        self.podcastdb = podcastdb
+
+        self.SUMMARY_CACHE = os.getenv("SUMMARY_CACHE", '1') == '1'
+        self.SUMMARY_CACHE_MAX_AGE_DAYS = int(os.getenv("SUMMARY_CACHE_MAX_AGE_DAYS", '180'))
+        self.SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", '10000'))
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0 # tokens not sent again
+
+
+    def __bool__(self):
+        return self.SUMMARY_CACHE
+
+
+    @staticmethod
+    def key(model, role, prompt)->str:
+        # the prompt holds the pre_prompt and the transcription (or the chunk): a new transcription or a new prompt is a new key
+        return hashlib.sha256(json.dumps([model, role, prompt]).encode('utf-8')).hexdigest()
+
+
+    def get(self, key)->tuple:
+        cached = self.podcastdb.summary_cache(key)
+        with self.lock:
+            if cached:
+                self.hits += 1
+                self.saved_tokens += cached['prompt_tokens'] + cached['completion_tokens']
+            else:
+                self.misses += 1
+
+        if cached:
+            # cached: the answer did not cost anything on this run
+            return cached['summary'], {'prompt_tokens': cached['prompt_tokens'], 'completion_tokens': cached['completion_tokens'], 'cached': True}
+        return None
+
+
+    def put(self, key, summary, usage):
+        self.podcastdb.update_summary_cache(key, summary, usage['prompt_tokens'], usage['completion_tokens'])
+
+
+    def evict(self)->int:
+        return self.podcastdb.evict_summary_cache(self.SUMMARY_CACHE_MAX_AGE_DAYS, self.SUMMARY_CACHE_MAX_ENTRIES)
+
+
+    def stats(self)->dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_tokens': self.saved_tokens
+        }
+
+
+    def log_stats(self):
+        prefix = f'[{self.__class__.__name__} | log_stats]'
+
+        stats = self.stats()
+        self.logs.logging_msg(f"{prefix} {stats['hits']} hits, {stats['misses']} misses, hit rate: {stats['hit_rate']:.0%}, {stats['saved_tokens']} tokens saved")
+
+
+######################################################################################################################################################
+class Prompts():
+    KEYS = ('role', 'pre_prompt', 'chunk_prompt', 'reduce_prompt')
+    REQUIRED = ('role', 'pre_prompt')
+    # $variables of the prompts, replaced by the values of the podcast
+    VARIABLES = ('category', 'podcast_name', 'title', 'published')
+
+    def __init__(self, logs, file_name):
+        self.logs = logs
+
+        # {category: {key: Template}}, built once: one dict lookup per summary
+        self.prompts = {}
+        self.default = None
+
+        try:
+            with open(file_name, 'r', encoding='utf-8') as file:
+                self.load(json.load(file))
+                self.logs.logging_msg(f"OpenAI prompts loaded: {len(self)} categories{', with default' if self.default else ''}", 'DEBUG')
+
+        except Exception as e:
+            self.logs.logging_msg(f"Error loading OpenAI prompts: {e}", 'ERROR')
+
+
+    def __len__(self):
+        return sum(1 for prompt in self.prompts.values() if prompt)
+
+
+    def load(self, openai_prompts):
+        prefix = f'[{self.__class__.__name__} | load]'
+
+        # "default": optional keys shared by all the categories, and prompt of the categories not in "podcasts"
+        defaults = {'chunk_prompt': CHUNK_PROMPT}
+        defaults.update(openai_prompts.get('default', {}))
+
+        if all(key in defaults for key in self.REQUIRED):
+            self.default = self.compile('default', defaults)
+
+        for podcast_prompt in openai_prompts['podcasts']:
+            category = podcast_prompt.get('category')
+            if category in self.prompts:
+                self.logs.logging_msg(f"{prefix} category '{category}' already defined, ignored", 'WARNING')
+                continue
+
+            # None: invalid prompt, the podcasts of the category are not summarized with the default one
+            self.prompts[category] = self.compile(category, {**defaults, **podcast_prompt})
+
+
+    def compile(self, category, prompt)->dict:
+        prefix = f'[{self.__class__.__name__} | compile]'
+
+        # reduce_prompt: pre_prompt by default
+        prompt = {key: prompt[key] for key in self.KEYS if key in prompt}
+        prompt.setdefault('reduce_prompt', prompt.get('pre_prompt'))
+
+        try:
+            missing = [key for key in self.REQUIRED if not prompt.get(key)]
+            if missing:
+                raise ValueError(f"missing {', '.join(missing)}")
+
+            templates = {}
+            for key, text in prompt.items():
+                template = Template(text)
+                # the unknown $names and the other $ (prices...) are kept as they are in the prompt
+                for match in template.pattern.finditer(text):
+                    name = match.group('named') or match.group('braced')
+                    if name and name not in self.VARIABLES:
+                        self.logs.logging_msg(f"{prefix} category '{category}', {key}: unknown variable {match.group(0)} kept as is (variables: {', '.join('$' + variable for variable in self.VARIABLES)})", 'WARNING')
+                templates[key] = template
+            return templates
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} category '{category}' ignored: {e}", 'ERROR')
+            return None
+
+
+    def get(self, podcast)->dict:
+        # {key: text} of the category of the podcast, or None: no prompt for this category
+        prompt = self.prompts.get(podcast.category, self.default)
+        if prompt is None:
+            return None
+
+        values = {
+            'category': podcast.category,
+            'podcast_name': podcast.name,
+            'title': podcast.title,
+            'published': podcast.published
+        }
+        return {key: template.safe_substitute(values) for key, template in prompt.items()}
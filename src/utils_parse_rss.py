@@ -1,14 +1,37 @@
-import feedparser
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from src.utils_http import HttpClient
+from src.utils_resolvers import RESOLVERS
+from xml.etree import ElementTree
+import statistics
+import hashlib
+import math
+import io
+import threading
+import time
 import json
 import os
 
 
 ######################################################################################################################################################
 class ParseRSS:
-    def __init__(self, logs, podcastdb):
+    def __init__(self, logs, podcastdb, http=None):
         self.logs = logs
         self.podcastdb = podcastdb
+        self.http = http if http else HttpClient(logs)
+
+        self.podcasts = []
+        self.report = []
+        self.link_index = None
+        self.reload()
+        self.parse_feeds()
 
+
+    def reload(self):
+        # settings, feeds JSON and scheduler, read again on SIGHUP by the daemon (the link index stays warm)
         self.DEBUG = os.getenv("DEBUG")
         if self.DEBUG == '0':
             self.RSS_FEEDS = os.getenv("RSS_FEEDS")
@@ -16,10 +39,13 @@ class ParseRSS:
             self.RSS_FEEDS = 'no.json'
         else:
             self.RSS_FEEDS = os.getenv("RSS_FEEDS_TEST")
+        self.RSS_WORKERS = int(os.getenv("RSS_WORKERS", '8'))
+        self.RSS_WORKERS_PER_HOST = int(os.getenv("RSS_WORKERS_PER_HOST", '2'))
+        self.RSS_TIMEOUT = float(os.getenv("RSS_TIMEOUT", '30'))
+        self.RSS_PARSER = os.getenv("RSS_PARSER", 'feedparser')
 
-        self.podcasts = []
         self.feeds = self.parse_json()
-        self.parse_feeds()
+        self.scheduler = FeedScheduler(self.logs, self.podcastdb)
     
 
     def parse_json(self):
@@ -37,86 +63,559 @@ class ParseRSS:
             return []
     
 
-    def parse_feeds(self):
+    def parse_feeds(self, force: bool = False)->list:
         prefix = f'[{self.__class__.__name__} | parse_feeds]'
 
         try:
-            for podcast in self.feeds:
-                self.podcasts.append(ParsePodcast(
-                    self.logs,
-                    self.podcastdb,
-                    podcast["category"],
-                    podcast["name"],
-                    podcast["rss_feed"]
-                ))
+            self.podcasts.clear()
+            self.report.clear()
+
+            # only the feeds due according to their publishing cadence (force: all the feeds)
+            feeds = list(self.feeds) if force else self.scheduler.due(self.feeds)
+            self.logs.logging_msg(f"{prefix} {len(feeds)}/{len(self.feeds)} feeds due", 'DEBUG')
+            if feeds and self.link_index is None:
+                self.link_index = LinkIndex(self.logs, self.podcastdb)
+
+            if self.RSS_WORKERS > 1 and len(feeds) > 1:
+                self.logs.logging_msg(f"{prefix} parallel fetch: {self.RSS_WORKERS} workers, {self.RSS_WORKERS_PER_HOST} per host", 'DEBUG')
+                host_semaphores = {
+                    urlparse(podcast["rss_feed"]).netloc: threading.BoundedSemaphore(self.RSS_WORKERS_PER_HOST)
+                    for podcast in feeds
+                }
+
+                # network only in the workers, parsing and inserts stay in the main thread and in the feeds order
+                # sliding window of RSS_WORKERS feeds: the host semaphores are taken here, in the order of the feeds,
+                # the oldest feed is parsed first when the window is full or its host busy (no fetch waits for a later feed)
+                with ThreadPoolExecutor(max_workers=self.RSS_WORKERS) as executor:
+                    window = deque()
+                    for podcast in feeds:
+                        semaphore = host_semaphores[urlparse(podcast["rss_feed"]).netloc]
+                        while len(window) >= self.RSS_WORKERS or not semaphore.acquire(blocking=False):
+                            self.add_fetched(*window.popleft())
+                        future = executor.submit(self.fetch_feed, podcast["rss_feed"], semaphore, self.podcastdb.feed_cache(podcast["rss_feed"]))
+                        window.append((podcast, future, semaphore))
+                    while window:
+                        self.add_fetched(*window.popleft())
+
+            else:
+                for podcast in feeds:
+                    self.add_podcast(podcast)
+
+            self.log_report()
         
         except Exception as e:
             self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
+
+        return self.report
+
+
+    def fetch_feed(self, rss_feed, semaphore, cache)->dict:
+        # semaphore taken by parse_feeds: released once the feed is downloaded, a stream only once it is parsed (add_fetched)
+        try:
+            return ParsePodcast.fetch_feed(rss_feed, self.RSS_TIMEOUT, cache, self.http, self.RSS_PARSER == 'stream')
+        finally:
+            if self.RSS_PARSER != 'stream':
+                semaphore.release()
+
+
+    def add_fetched(self, podcast, future, semaphore):
+        try:
+            self.add_podcast(podcast, future.result())
+        finally:
+            if self.RSS_PARSER == 'stream':
+                semaphore.release()
+
+
+    def add_podcast(self, podcast, fetched=None):
+        parse_podcast = ParsePodcast(
+            self.logs,
+            self.podcastdb,
+            podcast["category"],
+            podcast["name"],
+            podcast["rss_feed"],
+            fetched,
+            self.http,
+            self.link_index
+        )
+        self.podcasts.append(parse_podcast)
+        self.report.append(parse_podcast.report)
+
+
+    def log_report(self):
+        prefix = f'[{self.__class__.__name__} | log_report]'
+
+        errors = sum(1 for report in self.report if report['status'] == 'error')
+        skipped = sum(1 for report in self.report if report['status'] in ('not_modified', 'unchanged'))
+        fetch_time = sum(report['fetch_time'] for report in self.report)
+        self.logs.logging_msg(f"{prefix} {len(self.report)} feeds, {skipped} not modified, {errors} errors, cumulated fetch time: {fetch_time:.2f}s")
+        if self.link_index is not None:
+            self.link_index.log_stats()
+
+        for report in sorted(self.report, key=lambda report: report['fetch_time'], reverse=True):
+            self.logs.logging_msg(f"{prefix} [{report['status']}] fetch: {report['fetch_time']:.2f}s | parse: {report['parse_time']:.2f}s | entries: {report['entries']} (new: {report['inserted']}, known: {report['known']}, no link: {report['no_link']}) | {report['name']} ({report['host']})", 'DEBUG')
     
 
 ######################################################################################################################################################
 class ParsePodcast:
-    def __init__(self, logs, podcastdb, category, name, rss_feed):
+    ATOM = '{http://www.w3.org/2005/Atom}'
+    # episodes of the feed: <item> (RSS) or <entry> (Atom)
+    ENTRY_TAGS = ('item', f'{ATOM}entry')
+    INSERT_BATCH_SIZE = 500
+
+    def __init__(self, logs, podcastdb, category, name, rss_feed, fetched=None, http=None, link_index=None):
         self.logs = logs
         self.podcastdb = podcastdb
+        self.http = http if http else HttpClient(logs)
+        self.link_index = link_index # links of all the feeds, loaded once by ParseRSS
+
+        self.RSS_PARSER = os.getenv("RSS_PARSER", 'feedparser')
+        self.RSS_STOP_AFTER_KNOWN = int(os.getenv("RSS_STOP_AFTER_KNOWN", '20'))
         
         self.category = category
         self.name = name
         self.rss_feed = rss_feed
-        self.parse_podcast()
+        self.report = {
+            'name': name,
+            'rss_feed': rss_feed,
+            'host': urlparse(rss_feed).netloc,
+            'status': 'ok',
+            'entries': 0,
+            'inserted': 0,
+            'skipped': 0,
+            'failed': 0,
+            'no_link': 0,
+            'known': 0,
+            'fetch_time': 0.0,
+            'parse_time': 0.0,
+            'error': None
+        }
+        self.parse_podcast(fetched)
+
+
+    @staticmethod
+    def fetch_feed(rss_feed, timeout=30, cache=None, http=None, stream=False)->dict:
+        if http is None:
+            import requests
+            http = requests
+        fetched = {
+            'content': None,
+            'response': None, # stream: the response with its body not read yet
+            'headers': {},
+            'fetch_time': 0.0,
+            'error': None,
+            'not_modified': False,
+            'unchanged': False,
+            'etag': None,
+            'last_modified': None,
+            'content_hash': None
+        }
+        cache = cache or {}
+        start = time.perf_counter()
+
+        try:
+            # conditional GET: the server answers 304 when the feed has not changed since the last run
+            headers = {}
+            if cache.get('etag'):
+                headers['If-None-Match'] = cache['etag']
+            if cache.get('last_modified'):
+                headers['If-Modified-Since'] = cache['last_modified']
+
+            response = http.get(rss_feed, headers=headers, timeout=timeout, stream=stream)
+            if response.status_code == 304 or not response.ok:
+                response.close()
+            response.raise_for_status()
+
+            if response.status_code == 304:
+                fetched['not_modified'] = True
+            else:
+                fetched['headers'] = {key.lower(): value for key, value in response.headers.items()}
+                fetched['etag'] = response.headers.get('ETag')
+                fetched['last_modified'] = response.headers.get('Last-Modified')
+                if stream:
+                    # the body is downloaded while the entries are parsed, and hashed on the way (FeedStream)
+                    fetched['response'] = response
+                else:
+                    fetched['content'] = response.content
+                    # some servers ignore conditional requests: the body hash catches the unchanged feeds
+                    fetched['content_hash'] = hashlib.sha256(response.content).hexdigest()
+                    fetched['unchanged'] = fetched['content_hash'] == cache.get('content_hash')
+
+        except Exception as e:
+            fetched['error'] = e
+
+        fetched['fetch_time'] = time.perf_counter() - start
+        return fetched
 
 
-    def parse_podcast(self):
+    def parse_podcast(self, fetched=None):
         prefix = f'[{self.__class__.__name__} | parse_podcast]'
 
         try:
             self.logs.logging_msg(f"{prefix} feed_rss_url: {self.rss_feed}")
 
-            feed = feedparser.parse(self.rss_feed)
+            if fetched is None:
+                fetched = self.fetch_feed(self.rss_feed, cache=self.podcastdb.feed_cache(self.rss_feed), http=self.http, stream=self.RSS_PARSER == 'stream')
+            self.report['fetch_time'] = fetched['fetch_time']
+            if fetched['error']:
+                raise Exception(f"Failed to fetch RSS feed: {fetched['error']}")
 
-            if feed.bozo:
-                raise Exception(f"Failed to parse RSS feed: {feed.bozo_exception}")
+            if fetched['not_modified'] or fetched['unchanged']:
+                self.report['status'] = 'not_modified' if fetched['not_modified'] else 'unchanged'
+                self.podcastdb.update_feed_cache(self.rss_feed)
+                self.logs.logging_msg(f"{prefix} feed {self.report['status']}, skipped: {self.rss_feed}", 'DEBUG')
+                return
 
-            for entry in feed.entries:
-                self.logs.logging_msg(f"", 'DEBUG')
-                self.logs.logging_msg(f"", 'DEBUG')
+            start = time.perf_counter()
+            body = None
+            if self.RSS_PARSER == 'stream':
+                # O(new entries): the rest of a feed left after its known entries is never downloaded
+                body = FeedStream(fetched['response'])
+                entries = self.iter_entries(body)
+            else:
+                # O(feed): the whole feed is downloaded and parsed before its first entry is read
+                import feedparser # loaded by the first feed to parse, not by the runs without changed feeds
+                feed = feedparser.parse(fetched['content'], response_headers=fetched['headers'])
+                if feed.bozo:
+                    raise Exception(f"Failed to parse RSS feed: {feed.bozo_exception}")
+                entries = feed.entries
 
-                title = entry.get('title', 'No title')
+            # one resolver by feed: the link of each entry is the audio file when the feed gives it
+            resolver = RESOLVERS.resolver(self.rss_feed)
+            self.logs.logging_msg(f"{prefix} '{resolver.NAME}' resolver", 'DEBUG')
 
-                if 'feeds.acast.com' in self.rss_feed:
-                    links = entry.get('links', [])
-                    link = next((l['href'] for l in links if l['href'].startswith('https://sphinx.acast.com')), 'No link')
-                    self.logs.logging_msg(f"{prefix} 'feeds.acast.com' Podcast Link: {link}", 'DEBUG')
-                elif 'feed.ausha.co' in self.rss_feed:
-                    link = entry.get('link', 'No link')
-                    self.logs.logging_msg(f"{prefix} 'feed.ausha.co' Podcast Link: {link}", 'DEBUG')
-                elif 'anchor.fm' in self.rss_feed:
-                    link = next((enclosure['url'] for enclosure in entry.get('enclosures', []) if enclosure['url'].startswith('https://')), 'No link')
-                    self.logs.logging_msg(f"{prefix} 'anchor.fm' Podcast Link: {link}", 'DEBUG')
-                else:
-                    link = entry.get('', 'No link')
-                    self.logs.logging_msg(f"{prefix} OTHER Podcast Link: {link}", 'WARNING')
+            # only the new entries are prepared and logged, the streamed feed is left after a run of known entries (newest first)
+            known_links = self.link_index if self.link_index is not None else self.podcastdb.feed_links(self.rss_feed)
+            known_run = 0
+            podcasts = []
+            for entry in entries:
+                self.report['entries'] += 1
 
-                published = entry.get('published', 'No publish date')
+                link = resolver.feed_link(entry)
+                if not link:
+                    self.report['no_link'] += 1
+                    self.logs.logging_msg(f"{prefix} '{resolver.NAME}' no link for the entry: {entry.get('title', 'No title')}", 'WARNING')
+                    continue
+
+                if self.is_known(entry, link, known_links, resolver):
+                    self.report['known'] += 1
+                    known_run += 1
+                    if self.RSS_PARSER == 'stream' and 0 < self.RSS_STOP_AFTER_KNOWN <= known_run:
+                        self.logs.logging_msg(f"{prefix} {known_run} known entries in a row, end of the new entries", 'DEBUG')
+                        break
+                    continue
+                known_run = 0
 
+                title = entry.get('title', 'No title')
+                published = entry.get('published', 'No publish date')
                 description = entry.get('description', 'No description')
-                
-                self.logs.logging_msg(f"----------------------------------------------------------------------------------------------------", 'DEBUG')
-                self.logs.logging_msg(f"{prefix} Podcast Title: {title}", 'DEBUG')
-                self.logs.logging_msg(f"{prefix} Podcast Link: {link}", 'DEBUG')
-                self.logs.logging_msg(f"{prefix} Podcast Published Date: {published}", 'DEBUG')
-                self.logs.logging_msg(f"{prefix} Podcast Description: {description}", 'DEBUG')
-                self.logs.logging_msg(f"----------------------------------------------------------------------------------------------------", 'DEBUG')
+                self.logs.logging_msg(f"{prefix} new podcast: {title} | {published} | {link}", 'DEBUG')
+
+                podcasts.append((self.category, self.name, self.rss_feed, title, link, published, description))
+                if len(podcasts) >= self.INSERT_BATCH_SIZE:
+                    self.insert_podcasts(podcasts, known_links)
+                    podcasts = []
 
-                title = title.replace('"', "''")
-                link = link.replace('"', "''")
-                published = published.replace('"', "''")
-                description = description.replace('"', "''")
+            self.insert_podcasts(podcasts, known_links)
+            # entries not saved: the validators and the hash are not stored, the feed is parsed again on the next run
+            if self.report['failed']:
+                raise Exception(f"Failed to save {self.report['failed']} podcasts")
 
-                self.podcastdb.insert_podcast(self.category, self.name, self.rss_feed, title, link, published, description)
+            # a streamed feed left early has no hash: only its validators (ETag, Last-Modified) are saved
+            content_hash = body.content_hash() if body else fetched['content_hash']
+            self.podcastdb.update_feed_cache(self.rss_feed, fetched['etag'], fetched['last_modified'], content_hash)
 
+            self.report['parse_time'] = time.perf_counter() - start
             self.logs.logging_msg(f"{prefix} >> OK <<", 'DEBUG')
 
 
         except Exception as e:
-            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
\ No newline at end of file
+            self.report['status'] = 'error'
+            self.report['error'] = str(e)
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+
+        finally:
+            # the connection of a stream left early is closed, not kept in the pool with its unread body
+            if fetched and fetched.get('response') is not None:
+                fetched['response'].close()
+
+
+    def insert_podcasts(self, podcasts, known_links):
+        if podcasts:
+            result = self.podcastdb.insert_podcasts(podcasts)
+            self.report['inserted'] += result['inserted']
+            self.report['skipped'] += result['skipped']
+            self.report['failed'] += result['failed']
+            # only the links saved are known: the warm index of the daemon does not hide the lost entries
+            if not result['failed']:
+                for podcast in podcasts:
+                    known_links.add(podcast[4])
+
+
+    @staticmethod
+    def is_known(entry, link, known_links, resolver=None)->bool:
+        # the link stored by a previous run can be another link of the entry (page, enclosure) or its audio file
+        if link in known_links:
+            return True
+        return any(candidate in known_links for candidate in (resolver or RESOLVERS.default).entry_links(entry) if candidate != link)
+
+
+    @classmethod
+    def iter_entries(cls, content):
+        # incremental parse: one entry at a time, in the order of the document, each entry is freed once read
+        # content: the bytes of the feed or a file-like object read as the parser goes (FeedStream)
+        source = content if hasattr(content, 'read') else io.BytesIO(content)
+        parents = []
+        try:
+            for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    parents.append(element)
+                    continue
+
+                parents.pop()
+                if element.tag in cls.ENTRY_TAGS:
+                    yield cls.entry(element)
+                    element.clear()
+                    if parents:
+                        parents[-1].remove(element)
+
+        except ElementTree.ParseError as e:
+            raise Exception(f"Failed to parse RSS feed: {e}")
+
+
+    @classmethod
+    def entry(cls, element)->dict:
+        # same keys as the entries of feedparser, the enclosures are also in the links
+        entry = {'links': [], 'enclosures': []}
+        for child in element:
+            tag = child.tag
+            if tag == 'title' or tag == f'{cls.ATOM}title':
+                entry['title'] = (child.text or '').strip()
+            elif tag == 'link':
+                entry['link'] = (child.text or '').strip()
+                entry['links'].append({'rel': 'alternate', 'href': entry['link']})
+            elif tag == f'{cls.ATOM}link':
+                link = {'rel': child.get('rel', 'alternate'), 'href': child.get('href'), 'type': child.get('type', '')}
+                entry['links'].append(link)
+                if link['rel'] == 'enclosure':
+                    entry['enclosures'].append({'url': link['href'], 'type': link['type'], 'length': child.get('length')})
+                elif link['rel'] == 'alternate':
+                    entry.setdefault('link', link['href'])
+            elif tag == 'enclosure':
+                enclosure = {'url': child.get('url'), 'type': child.get('type', ''), 'length': child.get('length')}
+                entry['enclosures'].append(enclosure)
+                entry['links'].append({'rel': 'enclosure', 'href': enclosure['url'], 'type': enclosure['type']})
+            elif tag in ('pubDate', f'{cls.ATOM}published') or (tag == f'{cls.ATOM}updated' and 'published' not in entry):
+                entry['published'] = (child.text or '').strip()
+            elif tag in ('description', f'{cls.ATOM}summary') or (tag == f'{cls.ATOM}content' and 'description' not in entry):
+                entry['description'] = (child.text or '').strip()
+        return entry
+
+
+######################################################################################################################################################
+class FeedStream():
+    # body of a streamed response as a file for iterparse: only the chunks asked by the parser are downloaded
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, response):
+        self.chunks = response.iter_content(self.CHUNK_SIZE)
+        self.buffer = b''
+        self.sha256 = hashlib.sha256()
+        self.complete = False
+
+
+    def read(self, size=-1)->bytes:
+        while not self.complete and (size < 0 or len(self.buffer) < size):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.complete = True
+            else:
+                self.sha256.update(chunk)
+                self.buffer += chunk
+
+        size = len(self.buffer) if size < 0 else size
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+    def content_hash(self)->str:
+        # same hash as the whole body of the default mode, only for a body read to its end
+        return self.sha256.hexdigest() if self.complete else None
+
+
+######################################################################################################################################################
+class LinkIndex():
+    def __init__(self, logs, podcastdb):
+        self.logs = logs
+        self.podcastdb = podcastdb
+
+        # 'set': exact, in memory / 'bloom': compact Bloom filter, its positives are checked in the database
+        self.LINK_INDEX = os.getenv("LINK_INDEX", 'set')
+        self.LINK_INDEX_ERROR_RATE = float(os.getenv("LINK_INDEX_ERROR_RATE", '0.01'))
+
+        self.links = set()
+        self.bits = None
+        self.size = 0
+        self.lookups = 0
+        self.hits = 0
+        self.false_positives = 0
+        self.load()
+
+
+    def load(self):
+        start = time.perf_counter()
+
+        if self.LINK_INDEX == 'bloom':
+            # sized for twice the episodes already saved: room for the new ones of the run
+            capacity = max(2 * self.podcastdb.count_podcasts(), 1000)
+            self.nbits = math.ceil(-capacity * math.log(self.LINK_INDEX_ERROR_RATE) / math.log(2) ** 2)
+            self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+            self.bits = bytearray((self.nbits + 7) // 8)
+
+        for link in self.podcastdb.iter_links():
+            self.add(link)
+
+        self.load_time = time.perf_counter() - start
+
+
+    def positions(self, link):
+        # double hashing: the k positions from the two halves of one digest
+        digest = hashlib.blake2b(link.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.nbits for i in range(self.nhashes))
+
+
+    def add(self, link):
+        if self.bits is None:
+            self.links.add(link)
+        else:
+            self.size += 1
+            for position in self.positions(link):
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+
+    def __contains__(self, link)->bool:
+        self.lookups += 1
+        if self.bits is None:
+            found = link in self.links
+        else:
+            found = all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(link))
+            if found and not self.podcastdb.link_exists(link):
+                self.false_positives += 1
+                found = False
+
+        if found:
+            self.hits += 1
+        return found
+
+
+    def stats(self)->dict:
+        negatives = self.lookups - self.hits
+        return {
+            'type': self.LINK_INDEX,
+            'size': len(self.links) if self.bits is None else self.size,
+            'bytes': len(self.bits) if self.bits is not None else None,
+            'load_time': self.load_time,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'false_positive_rate': self.false_positives / negatives if negatives else 0.0
+        }
+
+
+    def log_stats(self):
+        prefix = f'[{self.__class__.__name__} | log_stats]'
+
+        stats = self.stats()
+        memory = f", {stats['bytes']} bytes" if stats['bytes'] is not None else ''
+        self.logs.logging_msg(f"{prefix} {stats['type']}: {stats['size']} links{memory}, loaded in {stats['load_time']:.2f}s, {stats['lookups']} lookups, {stats['hits']} known, false positive rate: {stats['false_positive_rate']:.2%}")
+
+
+######################################################################################################################################################
+class FeedScheduler():
+    def __init__(self, logs, podcastdb):
+        self.logs = logs
+        self.podcastdb = podcastdb
+
+        self.RSS_SCHEDULER = os.getenv("RSS_SCHEDULER", '1') == '1'
+        self.RSS_MIN_INTERVAL_HOURS = float(os.getenv("RSS_MIN_INTERVAL_HOURS", '1'))
+        self.RSS_MAX_INTERVAL_HOURS = float(os.getenv("RSS_MAX_INTERVAL_HOURS", '168'))
+        self.RSS_INTERVAL_FACTOR = float(os.getenv("RSS_INTERVAL_FACTOR", '0.25'))
+        self.RSS_CADENCE_EPISODES = int(os.getenv("RSS_CADENCE_EPISODES", '20'))
+        self.RSS_SCHEDULE_TOLERANCE_MINUTES = float(os.getenv("RSS_SCHEDULE_TOLERANCE_MINUTES", '5'))
+        self.DAEMON_MIN_SLEEP_SECONDS = float(os.getenv("DAEMON_MIN_SLEEP_SECONDS", '60'))
+
+        # last time each feed was found due by this process: a feed in error is not checked (checked_at) but waits its interval
+        self.attempts = {}
+
+
+    @staticmethod
+    def parse_date(published)->datetime:
+        # RFC 822 (RSS) or ISO 8601 (Atom), None: unknown format
+        for parse in (parsedate_to_datetime, datetime.fromisoformat):
+            try:
+                date = parse(published)
+                return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+            except (TypeError, ValueError, IndexError):
+                continue
+        return None
+
+
+    def interval(self, feed)->timedelta:
+        # manual override in the feeds JSON: "interval_hours" (0: at each run)
+        if 'interval_hours' in feed:
+            return timedelta(hours=float(feed['interval_hours']))
+
+        # a fraction of the median gap between the last episodes: a daily show is polled every few hours, a monthly one every week
+        dates = sorted(filter(None, (self.parse_date(published) for published in self.podcastdb.feed_published(feed['rss_feed']))))
+        dates = dates[-self.RSS_CADENCE_EPISODES:]
+        gaps = [(later - earlier).total_seconds() / 3600 for earlier, later in zip(dates, dates[1:]) if later > earlier]
+        if not gaps:
+            return timedelta(hours=self.RSS_MIN_INTERVAL_HOURS)
+
+        hours = statistics.median(gaps) * self.RSS_INTERVAL_FACTOR
+        return timedelta(hours=min(max(hours, self.RSS_MIN_INTERVAL_HOURS), self.RSS_MAX_INTERVAL_HOURS))
+
+
+    def next_check(self, feed)->datetime:
+        interval = self.interval(feed)
+        checked_at = self.podcastdb.feed_cache(feed['rss_feed']).get('checked_at')
+        # checked_at: datetime('now') of SQLite, in UTC
+        next_check = datetime.fromisoformat(checked_at).replace(tzinfo=timezone.utc) + interval if checked_at else datetime.now(timezone.utc)
+
+        attempted = self.attempts.get(feed['rss_feed'])
+        return max(next_check, attempted + interval) if attempted else next_check
+
+
+    def due(self, feeds)->list:
+        prefix = f'[{self.__class__.__name__} | due]'
+
+        if not self.RSS_SCHEDULER:
+            return list(feeds)
+
+        # tolerance: a feed due a few minutes after the run (cron) is not left for the next one
+        limit = datetime.now(timezone.utc) + timedelta(minutes=self.RSS_SCHEDULE_TOLERANCE_MINUTES)
+        due = []
+        for feed in feeds:
+            try:
+                next_check = self.next_check(feed)
+            except Exception as e:
+                self.logs.logging_msg(f"{prefix} {feed.get('rss_feed')}: {e}", 'WARNING')
+                next_check = limit
+            if next_check <= limit:
+                due.append(feed)
+                self.attempts[feed['rss_feed']] = datetime.now(timezone.utc)
+            else:
+                self.logs.logging_msg(f"{prefix} not due before {next_check:%Y-%m-%d %H:%M} UTC: {feed['name']}", 'DEBUG')
+        return due
+
+
+    def sleep_time(self, feeds)->float:
+        # seconds until the next feed is due (daemon mode): the interval of each feed already holds its minimum,
+        # a feed in error waits its interval after its last attempt, a feed due at once ("interval_hours": 0) waits DAEMON_MIN_SLEEP_SECONDS
+        if not feeds:
+            return self.RSS_MAX_INTERVAL_HOURS * 3600
+        if not self.RSS_SCHEDULER:
+            return self.RSS_MIN_INTERVAL_HOURS * 3600
+
+        next_check = min(self.next_check(feed) for feed in feeds)
+        return max((next_check - datetime.now(timezone.utc)).total_seconds(), self.DAEMON_MIN_SLEEP_SECONDS)
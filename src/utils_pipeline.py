@@ -0,0 +1,179 @@
+from itertools import chain
+import threading
+import queue
+import time
+import os
+
+
+######################################################################################################################################################
+class Pipeline:
+    def __init__(self, logs, podcastdb, podcasts):
+        self.logs = logs
+        self.podcastdb = podcastdb
+        self.podcasts = podcasts
+
+        self.PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", '4'))
+        self.PIPELINE_TRANSCRIBE_WORKERS = int(os.getenv("PIPELINE_TRANSCRIBE_WORKERS", '1'))
+        self.PIPELINE_SUMMARIZE_WORKERS = int(os.getenv("PIPELINE_SUMMARIZE_WORKERS", '2'))
+
+        self.limiter = podcasts.bandwidth_limiter()
+
+        # download > transcribe > summarize: an episode goes to the next stage as soon as its own work is done
+        # OPENAI_BATCH: no summarize stage, the transcribed episodes are submitted together once the pipeline is done (summarize_batch)
+        self.summarize = None if podcasts.OPENAI_BATCH else Stage(logs, 'summarize', podcasts.summarize_podcast, self.PIPELINE_SUMMARIZE_WORKERS, self.PIPELINE_QUEUE_SIZE)
+        self.transcribe = Stage(logs, 'transcribe', podcasts.transcribe_podcast, self.PIPELINE_TRANSCRIBE_WORKERS, self.PIPELINE_QUEUE_SIZE, self.summarize)
+        self.download = Stage(logs, 'download', self.download_podcast, max(podcasts.DOWNLOAD_WORKERS, 1), self.PIPELINE_QUEUE_SIZE, self.transcribe)
+        self.stages = [stage for stage in (self.download, self.transcribe, self.summarize) if stage]
+
+
+    def run(self)->bool:
+        prefix = f'[{self.__class__.__name__} | run]'
+
+        try:
+            start = time.perf_counter()
+
+            # the episodes already waiting for a stage are fed by one thread per stage,
+            # with the failed ones tried again (same filters as the stages of Podcasts)
+            podcasts = self.podcasts
+            feeders = [
+                (self.download, [{'downloaded': False}, {'downloaded': (2, 3)} if podcasts.DOWNLOAD_RETRY_FAILED else None]),
+                (self.transcribe, [{'downloaded': True, 'transcribed': False}, {'downloaded': True, 'transcribed': (2, 3)} if podcasts.WHISPER_RETRY_FAILED else None]),
+                (self.summarize, [{'downloaded': True, 'transcribed': True, 'summarized': False}, {'downloaded': True, 'transcribed': True, 'summarized': (2,)} if podcasts.OPENAI_RETRY_FAILED else None]),
+            ]
+            feeders = [(stage, filters) for stage, filters in feeders if stage]
+            for stage, _ in feeders:
+                stage.add_producers(1)
+            for stage in self.stages:
+                stage.start()
+
+            threads = [threading.Thread(target=self.feed, args=(stage, filters), name=f'feed-{stage.name}') for stage, filters in feeders]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for stage in self.stages:
+                stage.join()
+
+            for stage in self.stages:
+                self.logs.logging_msg(f"{prefix} {stage.name}: {stage.succeeded} ok, {stage.failed} failed")
+
+            # the batches of the previous runs are reconciled, then the pending summaries are submitted
+            if self.summarize is None:
+                self.logs.logging_msg(f"{prefix} summarize: Batch API")
+                self.podcasts.summarize_batch()
+            self.logs.logging_msg(f"{prefix} pipeline done in {time.perf_counter() - start:.1f}s")
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    def download_podcast(self, podcast)->bool:
+        downloaded = self.podcasts.download_podcast(podcast, self.limiter)
+        podcast.update_podcast()
+        return downloaded
+
+
+    def feed(self, stage, filters):
+        prefix = f'[{self.__class__.__name__} | feed]'
+
+        try:
+            # an episode failed again in this run is not fed twice (Stage.put)
+            for podcast in chain.from_iterable(self.podcasts.iter_podcasts(**stage_filters) for stage_filters in filters if stage_filters):
+                stage.put(podcast)
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+
+        finally:
+            stage.producer_done()
+
+
+######################################################################################################################################################
+class Stage:
+    def __init__(self, logs, name, function, workers, queue_size, next_stage=None):
+        self.logs = logs
+        self.name = name
+        self.function = function # function(podcast) -> True when the podcast can go to the next stage
+        self.workers = workers
+        self.next_stage = next_stage
+
+        # bounded queue: a slow stage blocks the previous one (back-pressure) instead of piling up episodes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.producers = 0
+        self.seen = set()
+        self.threads = []
+        self.succeeded = 0
+        self.failed = 0
+
+        if next_stage:
+            next_stage.add_producers(workers)
+
+
+    def add_producers(self, count):
+        with self.lock:
+            self.producers += count
+
+
+    def producer_done(self):
+        with self.lock:
+            self.producers -= 1
+            last = self.producers == 0
+
+        if last:
+            for _ in range(self.workers):
+                self.queue.put(None)
+
+
+    def put(self, podcast):
+        # an episode can be fed from the database and from the previous stage: it is only processed once
+        with self.lock:
+            if podcast.id in self.seen:
+                return
+            self.seen.add(podcast.id)
+        self.queue.put(podcast)
+
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.work, name=f'{self.name}-{i}') for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+    def work(self):
+        prefix = f'[{self.__class__.__name__} | {self.name}]'
+
+        try:
+            while True:
+                podcast = self.queue.get()
+                if podcast is None:
+                    break
+
+                try:
+                    start = time.perf_counter()
+                    ok = self.function(podcast)
+                    self.logs.logging_msg(f"{prefix} [{podcast.id}] {'ok' if ok else 'failed'} in {time.perf_counter() - start:.1f}s", 'DEBUG')
+
+                except Exception as e:
+                    ok = False
+                    self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
+
+                with self.lock:
+                    if ok:
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+
+                if ok and self.next_stage:
+                    self.next_stage.put(podcast)
+
+        finally:
+            if self.next_stage:
+                self.next_stage.producer_done()
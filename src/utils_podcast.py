@@ -1,47 +1,128 @@
-import openai
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from urllib.parse import urlparse
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from src.utils_http import HttpClient
+from src.utils_whisper import WhisperDispatcher
+from src.utils_mp3 import MP3Splitter
+from src.utils_openai import OpenAIClient, SummaryCache, Prompts
+from src.utils_resolvers import RESOLVERS
+from itertools import chain
+import importlib.util
+import threading
+import time
 import os
-import json
+
+
+# optional: lxml parses the pages faster than the parser of the standard library
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
 
 
 ######################################################################################################################################################
 class Podcasts():
-    def __init__(self, logs, podcastdb):
+    def __init__(self, logs, podcastdb, http=None):
         self.logs = logs
         self.podcastdb = podcastdb
+        self.http = http if http else HttpClient(logs)
 
         self.DEBUG = os.getenv("DEBUG")
         self.FOLDER_PATH = os.getenv("FOLDER_PATH")
         self.PREFIX = os.getenv("PREFIX")
         self.OPENAI_PROMPTS = os.getenv("OPENAI_PROMPTS")
+        self.DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", '4'))
+        self.DOWNLOAD_WORKERS_PER_HOST = int(os.getenv("DOWNLOAD_WORKERS_PER_HOST", '2'))
+        self.DOWNLOAD_MAX_BANDWIDTH = int(os.getenv("DOWNLOAD_MAX_BANDWIDTH", '0'))
+        self.DOWNLOAD_RETRY_FAILED = os.getenv("DOWNLOAD_RETRY_FAILED", '1') == '1'
+        self.WHISPER_RETRY_FAILED = os.getenv("WHISPER_RETRY_FAILED", '1') == '1'
+        self.WHISPER_SEGMENT_SECONDS = int(os.getenv("WHISPER_SEGMENT_SECONDS", '0'))
+        self.WHISPER_SEGMENT_OVERLAP = int(os.getenv("WHISPER_SEGMENT_OVERLAP", '5'))
+        self.OPENAI_RETRY_FAILED = os.getenv("OPENAI_RETRY_FAILED", '1') == '1'
+        self.OPENAI_BATCH = os.getenv("OPENAI_BATCH", '0') == '1'
         if self.DEBUG == '0':
             self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
         else:
             self.OPENAI_API_KEY = ""
 
-        try:
-            with open(self.OPENAI_PROMPTS, 'r', encoding='utf-8') as file:
-                self.openai_prompts = json.load(file)
-                self.logs.logging_msg(f"OpenAI prompts loaded", 'DEBUG')
+        self.prompts = Prompts(logs, self.OPENAI_PROMPTS)
 
-        except Exception as e:
-            self.logs.logging_msg(f"Error loading OpenAI prompts: {e}", 'ERROR')
-            self.openai_prompts = {}
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        # chunks of the map-reduce summaries, shared by all the episodes: OPENAI_WORKERS chunk requests at most
+        self.chunk_executor = None
+        self.chunk_executor_lock = threading.Lock()
+        self.whisper = WhisperDispatcher(logs, self.http)
+        self.summary_cache = SummaryCache(logs, podcastdb)
+        self.openai = OpenAIClient(logs, self.OPENAI_API_KEY, self.summary_cache, self.http)
 
-        self.podcasts = []
+        Podcast.load_settings()
+        try:
+            os.makedirs(f'./{self.FOLDER_PATH}/', exist_ok=True)
+        except Exception as e:
+            self.logs.logging_msg(f"Error creating the folder '{self.FOLDER_PATH}': {e}", 'ERROR')
     
 
+    def reload(self):
+        # prompts read again on SIGHUP by the daemon
+        self.OPENAI_PROMPTS = os.getenv("OPENAI_PROMPTS")
+        self.prompts = Prompts(self.logs, self.OPENAI_PROMPTS)
+
+
+    def close(self):
+        self.whisper.stop()
+        if self.chunk_executor is not None:
+            self.chunk_executor.shutdown()
+            self.chunk_executor = None
+        self.openai.log_stats()
+        if self.summary_cache:
+            self.summary_cache.log_stats()
+
+
+    def iter_podcasts(self, **filters):
+        # rows are read by batches: the memory of a stage does not depend on the size of the history
+        for podcast in self.podcastdb.iter_podcasts(**filters):
+            podcast.http = self.http
+            yield podcast
+
+
     def download_podcasts(self)->bool:
         prefix = f'[{self.__class__.__name__} | download_podcasts]'
 
         try:
-            self.podcasts.clear()
-            self.podcasts = self.podcastdb.podcasts(downloaded=False)
+            limiter = self.bandwidth_limiter()
+
+            # failed downloads (2: download error, 3: no audio found in the page) tried again, from the audio file already resolved
+            podcasts = self.iter_podcasts(downloaded=False)
+            if self.DOWNLOAD_RETRY_FAILED:
+                podcasts = chain(podcasts, self.iter_podcasts(downloaded=(2, 3)))
+            seen = set()
+
+            if self.DOWNLOAD_WORKERS > 1:
+                self.logs.logging_msg(f"{prefix} parallel download: {self.DOWNLOAD_WORKERS} workers, {self.DOWNLOAD_WORKERS_PER_HOST} per host", 'DEBUG')
+                futures = {}
+
+                # the workers only download, the statuses are written by this thread in the single SQLite connection
+                with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor, self.podcastdb.batch():
+                    for podcast in podcasts:
+                        if podcast.id in seen: # failed in this run
+                            continue
+                        seen.add(podcast.id)
+
+                        if len(futures) >= 2 * self.DOWNLOAD_WORKERS:
+                            self.update_podcasts(futures, FIRST_COMPLETED)
+
+                        futures[executor.submit(self.download_podcast, podcast, limiter)] = podcast
+
+                    self.update_podcasts(futures)
+
+            else:
+                with self.podcastdb.batch():
+                    for podcast in podcasts:
+                        if podcast.id in seen:
+                            continue
+                        seen.add(podcast.id)
 
-            for podcast in self.podcasts:
-                podcast.download_podcast()
-                podcast.update_podcast()
+                        podcast.download_podcast(limiter)
+                        podcast.update_podcast()
             
             return True
 
@@ -50,102 +131,252 @@ class Podcasts():
             return False
 
 
+    def bandwidth_limiter(self):
+        return BandwidthLimiter(self.DOWNLOAD_MAX_BANDWIDTH) if self.DOWNLOAD_MAX_BANDWIDTH > 0 else None
+
+
+    def host_semaphore(self, link)->threading.BoundedSemaphore:
+        host = urlparse(link).netloc
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.DOWNLOAD_WORKERS_PER_HOST)
+            return self.host_semaphores[host]
+
+
+    def update_podcasts(self, futures, return_when=ALL_COMPLETED):
+        done, _ = wait(futures, return_when=return_when)
+        for future in done:
+            futures.pop(future).update_podcast()
+
+
+    def download_podcast(self, podcast, limiter=None)->bool:
+        with self.host_semaphore(podcast.media_url or podcast.link):
+            podcast.download_podcast(limiter)
+        return podcast.downloaded == 1
+
+
     def transcribe_podcasts(self):
         prefix = f'[{self.__class__.__name__} | transcribe_podcasts]'
 
         try:
-            self.podcasts.clear()
-            self.podcasts = self.podcastdb.podcasts(downloaded=True, transcribed=False)
-
-            for podcast in self.podcasts:
-                podcast_file_name = os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.mp3')
-                text_file_name    = os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.txt')
-                self.logs.logging_msg(f"{prefix} podcast_file_name: {podcast_file_name}", 'DEBUG')
-                self.logs.logging_msg(f"{prefix} text_file_name: {text_file_name}", 'DEBUG')
-
-                ###############
-                ### WHISPER ###
-                ###############
-                try:
-                    response = requests.post('http://127.0.0.1:9000/transcribe/', params={'file_path': podcast_file_name})
-                    response_data = response.json()
+            podcasts = self.iter_podcasts(downloaded=True, transcribed=False)
+            if self.WHISPER_RETRY_FAILED:
+                podcasts = chain(podcasts, self.iter_podcasts(downloaded=True, transcribed=(2, 3)))
 
-                    if response.status_code == 200:
-                        podcast.transcribed = 1
-                        self.logs.logging_msg(f"{prefix} [API status:{response.status_code}] Transcription successful for podcast: [{podcast.id}] {podcast.title}", 'DEBUG')
-                    else:
-                        podcast.transcribed = 2
-                        self.logs.logging_msg(f"{prefix} [API status:{response.status_code}] Transcription failed for podcast: [{podcast.id}] {podcast.title} with error: {response_data.get('error', 'Unknown error')}", 'ERROR')
-                
-                except Exception as e:
-                    podcast.transcribed = 3
-                    self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
-
-                ############################
-                ### REPLACE .MP3 BY .TXT ###
-                ############################
-                if podcast.transcribed == 1:
-                    try:
-                        with open(text_file_name, 'w', encoding='utf-8') as text_file:
-                            text_file.write(response_data.get('transcription_text', ''))
-                        self.logs.logging_msg(f"{prefix} Transcription saved: {text_file_name}", 'DEBUG')
-
-                        os.remove(podcast_file_name)
-                        self.logs.logging_msg(f"{prefix} Podcast file removed: {podcast_file_name}", 'DEBUG')
-
-                    except Exception as e:
-                        podcast.transcribed = 4
-                        self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
-                        
-                podcast.update_podcast()
+            self.logs.logging_msg(f"{prefix} {len(self.whisper.backends)} Whisper backends, {self.whisper.capacity} jobs in flight", 'DEBUG')
+            seen = set()
+            futures = {}
+
+            # the jobs are dispatched to the Whisper backends, the results are saved by this thread
+            with self.podcastdb.batch():
+                for podcast in podcasts:
+                    if podcast.id in seen: # failed in this run, already retried by the dispatcher
+                        continue
+                    seen.add(podcast.id)
+
+                    if len(futures) >= 2 * self.whisper.capacity:
+                        self.save_transcriptions(futures, FIRST_COMPLETED)
+                    futures[self.submit_transcription(podcast)] = podcast
+
+                self.save_transcriptions(futures)
 
         except Exception as e:
             self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
 
 
+    def save_transcriptions(self, futures, return_when=ALL_COMPLETED):
+        done, _ = wait(futures, return_when=return_when)
+        for future in done:
+            self.save_transcription(futures.pop(future), *future.result())
+
+
+    def transcribe_podcast(self, podcast)->bool:
+        status, response_data = self.submit_transcription(podcast).result()
+        return self.save_transcription(podcast, status, response_data)
+
+
+    def submit_transcription(self, podcast)->Future:
+        prefix = f'[{self.__class__.__name__} | submit_transcription]'
+
+        podcast_file_name = self.podcast_file_name(podcast)
+        if self.WHISPER_SEGMENT_SECONDS > 0:
+            try:
+                splitter = MP3Splitter(podcast_file_name)
+                if splitter.scan() > 2 * self.WHISPER_SEGMENT_SECONDS:
+                    return self.submit_segments(podcast, splitter)
+
+            except Exception as e:
+                self.logs.logging_msg(f"{prefix} can't split {podcast_file_name}, transcribed in one job: {e}", 'WARNING')
+
+        return self.whisper.submit(podcast_file_name)
+
+
+    def submit_segments(self, podcast, splitter)->Future:
+        prefix = f'[{self.__class__.__name__} | submit_segments]'
+
+        # long episode: overlapping segments transcribed in parallel, the segments already transcribed by a previous run are kept
+        segments = splitter.segments(self.WHISPER_SEGMENT_SECONDS, self.WHISPER_SEGMENT_OVERLAP)
+        done = self.podcastdb.transcription_segments(podcast.id)
+        pending = [segment for segment in segments if segment not in done]
+        self.logs.logging_msg(f"{prefix} [{podcast.id}] {len(segments)} segments, {len(pending)} to transcribe", 'DEBUG')
+
+        file_names = []
+        for start, end in pending:
+            file_names.append(os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}_{int(start)}s.mp3'))
+            splitter.write(start, end, file_names[-1])
+
+        def save_segment(index, status, response_data):
+            if status == 1:
+                start, end = pending[index]
+                self.podcastdb.save_transcription_segment(podcast.id, start, end, response_data.get('transcription_text', ''))
+                os.remove(file_names[index])
+
+        def stitch(segments_future):
+            try:
+                failed = [status for status, _ in segments_future.result() if status != 1]
+                if failed:
+                    future.set_result((failed[0], {'error': f"{len(failed)} / {len(segments)} segments failed"}))
+                else:
+                    texts = self.podcastdb.transcription_segments(podcast.id)
+                    future.set_result((1, {'transcription_text': self.whisper.stitch(texts[segment] for segment in segments)}))
+
+            except Exception as e:
+                future.set_result((3, {'error': str(e)}))
+
+        future = Future()
+        self.whisper.submit_segments(file_names, save_segment).add_done_callback(stitch)
+        return future
+
+
+    def podcast_file_name(self, podcast)->str:
+        return os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.mp3')
+
+
+    def save_transcription(self, podcast, status, response_data)->bool:
+        prefix = f'[{self.__class__.__name__} | save_transcription]'
+
+        podcast_file_name = self.podcast_file_name(podcast)
+        text_file_name    = os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.txt')
+        self.logs.logging_msg(f"{prefix} podcast_file_name: {podcast_file_name}", 'DEBUG')
+        self.logs.logging_msg(f"{prefix} text_file_name: {text_file_name}", 'DEBUG')
+
+        ###############
+        ### WHISPER ###
+        ###############
+        podcast.transcribed = status
+        if status == 1:
+            self.logs.logging_msg(f"{prefix} Transcription successful for podcast: [{podcast.id}] {podcast.title}", 'DEBUG')
+        else:
+            self.logs.logging_msg(f"{prefix} Transcription failed for podcast: [{podcast.id}] {podcast.title} with error: {response_data.get('error', 'Unknown error')}", 'ERROR')
+
+        ############################
+        ### REPLACE .MP3 BY .TXT ###
+        ############################
+        if podcast.transcribed == 1:
+            try:
+                with open(text_file_name, 'w', encoding='utf-8') as text_file:
+                    text_file.write(response_data.get('transcription_text', ''))
+                self.logs.logging_msg(f"{prefix} Transcription saved: {text_file_name}", 'DEBUG')
+
+                os.remove(podcast_file_name)
+                self.logs.logging_msg(f"{prefix} Podcast file removed: {podcast_file_name}", 'DEBUG')
+                self.podcastdb.delete_transcription_segments(podcast.id)
+
+            except Exception as e:
+                podcast.transcribed = 4
+                self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
+            
+        podcast.update_podcast()
+        return podcast.transcribed == 1
+
+
     def summarize_podcasts(self)->bool:
         prefix = f'[{self.__class__.__name__} | summarize_podcasts]'
 
+        if self.OPENAI_BATCH:
+            return self.summarize_batch()
+
         try:
-            openai.api_key = self.OPENAI_API_KEY
+            podcasts = self.iter_podcasts(downloaded=True, transcribed=True, summarized=False)
+            if self.OPENAI_RETRY_FAILED:
+                podcasts = chain(podcasts, self.iter_podcasts(downloaded=True, transcribed=True, summarized=(2,)))
 
-            self.podcasts.clear()
-            self.podcasts = self.podcastdb.podcasts(downloaded=True, transcribed=True, summarized=False)
+            self.logs.logging_msg(f"{prefix} {self.openai.OPENAI_WORKERS} workers, {self.openai.OPENAI_RPM} requests/min, {self.openai.OPENAI_TPM} tokens/min", 'DEBUG')
+            if self.summary_cache:
+                self.summary_cache.evict()
+            seen = set()
+            futures = {}
 
-            for podcast in self.podcasts:
-                try:
-                    text_file_name    = os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.txt')
-                    
-                    podcasts_prompt = self.openai_prompts['podcasts']
-                    for podcast_prompt in podcasts_prompt:
-                        if podcast_prompt['category'] == podcast.category:
-                            role = podcast_prompt['role']
-                            pre_prompt = podcast_prompt['pre_prompt']
-                            break
-                    
-                    prompt = pre_prompt + "\n\nTranscription:\n" + open(text_file_name, 'r', encoding='utf-8').read()
-
-                    ##################
-                    ### OPENAI API ###
-                    ##################
-                    response = openai.ChatCompletion.create(
-                        # model="gpt-4",
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": role},
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
-                    
-                    podcast.summarized = 1
-                    podcast.summary = response['choices'][0]['message']['content']
-                    self.logs.logging_msg(f"{prefix} Summarization successful for podcast: [{podcast.id}] {podcast.title}", 'DEBUG')
+            # the workers wait for the rate limits and the API, the summaries are written by this thread
+            with ThreadPoolExecutor(max_workers=max(self.openai.OPENAI_WORKERS, 1)) as executor, self.podcastdb.batch():
+                for podcast in podcasts:
+                    if podcast.id in seen: # failed in this run, already retried by the OpenAI client
+                        continue
+                    seen.add(podcast.id)
 
-                except Exception as e:
-                    podcast.summarized = 2
-                    self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
-                
-                podcast.update_podcast()
+                    if len(futures) >= 2 * self.openai.OPENAI_WORKERS:
+                        self.update_podcasts(futures, FIRST_COMPLETED)
+                    futures[executor.submit(self.summarize, podcast)] = podcast
+
+                self.update_podcasts(futures)
+
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    def summarize_batch(self)->bool:
+        prefix = f'[{self.__class__.__name__} | summarize_batch]'
+
+        # Batch API (no real time, lower price): the batches of the previous runs are reconciled, then the pending summaries are submitted
+        # summarized: 4 in a batch not reconciled yet
+        try:
+            self.reconcile_batches()
+
+            podcasts = self.iter_podcasts(downloaded=True, transcribed=True, summarized=False)
+            if self.OPENAI_RETRY_FAILED:
+                podcasts = chain(podcasts, self.iter_podcasts(downloaded=True, transcribed=True, summarized=(2,)))
+
+            if self.summary_cache:
+                self.summary_cache.evict()
+            seen = set()
+            batch = []
+
+            with self.podcastdb.batch():
+                for podcast in podcasts:
+                    if podcast.id in seen:
+                        continue
+                    seen.add(podcast.id)
+
+                    prepared = self.prepare(podcast)
+                    if not prepared:
+                        podcast.update_podcast()
+                        continue
+                    podcast_prompt, transcription = prepared
+
+                    # the map-reduce needs the summaries of the chunks before the reduce request: no batch for the long transcriptions
+                    if self.openai.OPENAI_CHUNK_TOKENS > 0 and self.openai.count_tokens(transcription) > self.openai.OPENAI_CHUNK_TOKENS:
+                        self.summarize_podcast(podcast)
+                        continue
+
+                    role = podcast_prompt['role']
+                    prompt = podcast_prompt['pre_prompt'] + "\n\nTranscription:\n" + transcription
+                    key = self.summary_cache.key(self.openai.OPENAI_MODEL, role, prompt) if self.summary_cache else None
+                    cached = self.summary_cache.get(key) if key else None
+                    if cached:
+                        self.save_summary(podcast, *cached)
+                        podcast.update_podcast()
+                        continue
+
+                    batch.append((podcast, key, self.openai.batch_request(f'podcast-{podcast.id}', role, prompt)))
+                    if len(batch) >= self.openai.OPENAI_BATCH_MAX_REQUESTS:
+                        self.submit_batch(batch)
+                        batch = []
+
+                if batch:
+                    self.submit_batch(batch)
 
             return True
 
@@ -154,11 +385,207 @@ class Podcasts():
             return False
 
 
+    def submit_batch(self, batch)->bool:
+        prefix = f'[{self.__class__.__name__} | submit_batch]'
+
+        # batch: list of (podcast, cache key, request)
+        try:
+            response = self.openai.submit_batch([request for _, _, request in batch])
+            self.podcastdb.save_openai_batch(response['id'], response['status'], [(request['custom_id'], podcast.id, key) for podcast, key, request in batch])
+            self.logs.logging_msg(f"{prefix} batch {response['id']}: {len(batch)} summaries submitted", 'DEBUG')
+            status = 4
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'ERROR')
+            status = 2
+
+        for podcast, _, _ in batch:
+            podcast.summarized = status
+            podcast.update_podcast()
+        return status == 4
+
+
+    def reconcile_batches(self):
+        prefix = f'[{self.__class__.__name__} | reconcile_batches]'
+
+        for batch_id in self.podcastdb.openai_batches(self.openai.BATCH_DONE):
+            try:
+                response = self.openai.retrieve_batch(batch_id)
+                if response['status'] not in self.openai.BATCH_DONE:
+                    self.podcastdb.update_openai_batch(batch_id, response['status'])
+                    self.logs.logging_msg(f"{prefix} batch {batch_id}: {response['status']}", 'DEBUG')
+                    continue
+
+                results = {}
+                for file_id in (response.get('output_file_id'), response.get('error_file_id')):
+                    if file_id:
+                        results.update({custom_id: result for custom_id, result in self.openai.batch_results(file_id).items() if custom_id not in results or result})
+
+                # podcasts without a result (failed, expired or cancelled batch): summarized = 2, tried again on the next run
+                batch_requests = self.podcastdb.openai_batch_requests(batch_id)
+                with self.podcastdb.batch():
+                    for podcast in self.iter_podcasts(summarized=(4,)):
+                        if podcast.id not in batch_requests:
+                            continue
+                        custom_id, key = batch_requests[podcast.id]
+                        result = results.get(custom_id)
+                        if result:
+                            summary, usage = result
+                            self.save_summary(podcast, summary, usage, self.openai.OPENAI_BATCH_PRICE_FACTOR)
+                            if key and self.summary_cache:
+                                self.summary_cache.put(key, summary, usage)
+                        else:
+                            podcast.summarized = 2
+                        podcast.update_podcast()
+
+                self.podcastdb.update_openai_batch(batch_id, response['status'])
+                self.logs.logging_msg(f"{prefix} batch {batch_id}: {response['status']}, {sum(1 for result in results.values() if result)}/{len(batch_requests)} summaries")
+
+            except Exception as e:
+                self.logs.logging_msg(f"{prefix} batch {batch_id}: Error: {e}", 'WARNING')
+
+
+    def save_summary(self, podcast, summary, usage, factor=1.0):
+        prefix = f'[{self.__class__.__name__} | save_summary]'
+
+        podcast.summary = summary
+        podcast.prompt_tokens = usage['prompt_tokens']
+        podcast.completion_tokens = usage['completion_tokens']
+        # usage['cost']: map-reduce summary, only its requests not answered by the cache
+        podcast.summary_cost = usage['cost'] if 'cost' in usage else self.openai.billed_cost([usage], factor)
+        podcast.summarized = 1
+        self.logs.logging_msg(f"{prefix} Summarization successful for podcast: [{podcast.id}] {podcast.title} ({podcast.prompt_tokens} + {podcast.completion_tokens} tokens, ${podcast.summary_cost:.4f})", 'DEBUG')
+
+
+    def summarize_podcast(self, podcast)->bool:
+        summarized = self.summarize(podcast)
+        podcast.update_podcast()
+        return summarized
+
+
+    def summarize(self, podcast)->bool:
+        prefix = f'[{self.__class__.__name__} | summarize]'
+
+        # summarized: 1 done, 2 API error (tried again on the next run), 3 nothing to summarize (no prompt or no transcription)
+        prepared = self.prepare(podcast)
+        if not prepared:
+            return False
+        podcast_prompt, transcription = prepared
+        role = podcast_prompt['role']
+        pre_prompt = podcast_prompt['pre_prompt']
+
+        ##################
+        ### OPENAI API ###
+        ##################
+        try:
+            if self.openai.OPENAI_CHUNK_TOKENS > 0 and self.openai.count_tokens(transcription) > self.openai.OPENAI_CHUNK_TOKENS:
+                summary, usage = self.map_reduce(podcast, podcast_prompt, transcription)
+            else:
+                summary, usage = self.openai.chat(role, pre_prompt + "\n\nTranscription:\n" + transcription)
+
+            self.save_summary(podcast, summary, usage)
+
+        except Exception as e:
+            podcast.summarized = 2
+            self.logs.logging_msg(f"{prefix} [{podcast.id}] Error: {e}", 'ERROR')
+    
+        return podcast.summarized == 1
+
+
+    def prepare(self, podcast)->tuple:
+        prefix = f'[{self.__class__.__name__} | prepare]'
+
+        # (prompts of the category, transcription) or None: nothing to summarize (summarized = 3)
+        try:
+            prompt = self.prompts.get(podcast)
+            if prompt is None:
+                raise KeyError(f"no prompt for the category '{podcast.category}'")
+
+            text_file_name    = os.path.abspath(f'./{self.FOLDER_PATH}/{self.PREFIX}{podcast.id}.txt')
+            with open(text_file_name, 'r', encoding='utf-8') as text_file:
+                transcription = text_file.read()
+
+            return prompt, transcription
+
+        except Exception as e:
+            podcast.summarized = 3
+            self.logs.logging_msg(f"{prefix} [{podcast.id}] Error: {e}", 'ERROR')
+            return None
+
+
+    def chunk_pool(self)->ThreadPoolExecutor:
+        with self.chunk_executor_lock:
+            if self.chunk_executor is None:
+                self.chunk_executor = ThreadPoolExecutor(max_workers=max(self.openai.OPENAI_WORKERS, 1), thread_name_prefix='openai-chunk')
+            return self.chunk_executor
+
+
+    def map_reduce(self, podcast, podcast_prompt, transcription)->tuple:
+        prefix = f'[{self.__class__.__name__} | map_reduce]'
+
+        # long transcription: each chunk is summarized (in parallel), then the summaries of the chunks are summarized
+        # optional keys of the category in OPENAI_PROMPTS: 'chunk_prompt' (default: CHUNK_PROMPT), 'reduce_prompt' (default: 'pre_prompt')
+        role = podcast_prompt['role']
+        chunk_prompt = podcast_prompt['chunk_prompt']
+        reduce_prompt = podcast_prompt['reduce_prompt']
+
+        chunks = self.openai.split(transcription, self.openai.OPENAI_CHUNK_TOKENS)
+        self.logs.logging_msg(f"{prefix} [{podcast.id}] {len(chunks)} chunks", 'DEBUG')
+
+        def summarize_chunk(index):
+            return self.openai.chat(role, f"{chunk_prompt}\n\nTranscription (part {index + 1}/{len(chunks)}):\n{chunks[index]}")
+
+        # the summarization workers only wait for their chunks: no pool per episode (OPENAI_WORKERS² threads on the rate limiter)
+        results = list(self.chunk_pool().map(summarize_chunk, range(len(chunks))))
+
+        summaries = "\n\n".join(f"Part {index + 1}/{len(chunks)}:\n{summary}" for index, (summary, _) in enumerate(results))
+        summary, reduce_usage = self.openai.chat(role, reduce_prompt + "\n\nSummaries of the successive parts of the transcription:\n" + summaries)
+
+        usages = [reduce_usage] + [chunk_usage for _, chunk_usage in results]
+        usage = {
+            'prompt_tokens': sum(request_usage['prompt_tokens'] for request_usage in usages),
+            'completion_tokens': sum(request_usage['completion_tokens'] for request_usage in usages),
+            'cost': self.openai.billed_cost(usages),
+        }
+        return summary, usage
+
+
 ######################################################################################################################################################
 class Podcast():
-    def __init__(self, logs, podcastdb, id, category, name, rss_feed, title, link, published, description, downloaded, transcribed, summarized, summary=None):
+    # one compact record per row: no per-instance I/O, the settings are shared by the class
+    __slots__ = ('logs', 'podcastdb', 'http', 'dirty', 'id', 'category', 'name', 'rss_feed', 'title', 'link', 'published', 'description', 'downloaded', 'transcribed', 'summarized', 'summary', 'prompt_tokens', 'completion_tokens', 'summary_cost', 'media_url', 'media_size', 'media_type')
+
+    # attribute > column in the table `podcasts`
+    COLUMNS = {
+        'category': 'category',
+        'name': 'podcast_name',
+        'rss_feed': 'rss_feed',
+        'title': 'title',
+        'link': 'link',
+        'published': 'published',
+        'description': 'description',
+        'downloaded': 'downloaded',
+        'transcribed': 'transcribed',
+        'summarized': 'summarized',
+        'summary': 'summary',
+        'prompt_tokens': 'prompt_tokens',
+        'completion_tokens': 'completion_tokens',
+        'summary_cost': 'summary_cost',
+        'media_url': 'media_url',
+        'media_size': 'media_size',
+        'media_type': 'media_type'
+    }
+
+    FOLDER_PATH = None
+    PREFIX = None
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    DOWNLOAD_TIMEOUT = 60.0
+
+    def __init__(self, logs, podcastdb, id, category, name, rss_feed, title, link, published, description, downloaded, transcribed, summarized, summary=None, prompt_tokens=0, completion_tokens=0, summary_cost=0.0, media_url=None, media_size=None, media_type=None, http=None):
+        self.dirty = set() # changed columns, written by update_podcast()
         self.logs = logs
         self.podcastdb = podcastdb
+        self.http = http if http else requests
 
         self.id = id
         self.category = category
@@ -172,75 +599,75 @@ class Podcast():
         self.transcribed = transcribed
         self.summarized = summarized
         self.summary = summary
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.summary_cost = summary_cost
+        self.media_url = media_url # audio file of the link, resolved once
+        self.media_size = media_size
+        self.media_type = media_type
 
-        self.FOLDER_PATH = os.getenv("FOLDER_PATH")
-        self.PREFIX = os.getenv("PREFIX")
 
-        os.makedirs(f'./{self.FOLDER_PATH}/', exist_ok=True)
+    def __setattr__(self, name, value):
+        if name in self.COLUMNS:
+            try:
+                if getattr(self, name) != value:
+                    self.dirty.add(name)
+            except AttributeError: # first assignment in __init__
+                pass
+        object.__setattr__(self, name, value)
+
+
+    @classmethod
+    def load_settings(cls):
+        cls.FOLDER_PATH = os.getenv("FOLDER_PATH")
+        cls.PREFIX = os.getenv("PREFIX")
+        cls.DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+        cls.DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", '60'))
     
 
-    def update_podcast(self):
+    def update_podcast(self)->bool:
         prefix = f'[{self.__class__.__name__} | update_podcast]'
 
         try:
-            request = f'''
-UPDATE podcasts
-   SET category = "{self.category}",
-       podcast_name = "{self.name}",
-       rss_feed = "{self.rss_feed}",
-       title = "{self.title}",
-       link = "{self.link}",
-       published = "{self.published}",
-       description = "{self.description}",
-       downloaded = {self.downloaded},
-       transcribed = {self.transcribed},
-       summarized = {self.summarized},
-       summary = "{self.summary}"
- WHERE id = {self.id}
-'''
-            self.podcastdb.update_podcast(request)
-            self.logs.logging_msg(f"{prefix} podcast updated: [{self.id}] {self.title}", 'DEBUG')
+            if not self.dirty:
+                return True
+
+            # only the changed columns are written
+            columns = {self.COLUMNS[name]: getattr(self, name) for name in self.dirty}
+            if self.podcastdb.update_podcast_columns(self.id, columns):
+                self.dirty.clear()
+                self.logs.logging_msg(f"{prefix} podcast updated: [{self.id}] {self.title}", 'DEBUG')
+                return True
+            return False
 
         except Exception as e:
             self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
     
 
-    def download_podcast(self):
+    def download_podcast(self, limiter=None):
         prefix = f'[{self.__class__.__name__} | download_podcast]'
 
         try:
             self.logs.logging_msg(f"{prefix} downloading podcast: [{self.id}] {self.title}", 'DEBUG')
 
+            # a retry starts from the failed status
+            self.downloaded = 0
+
             try:
-                response = requests.get(self.link)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                if self.link.startswith('https://shows.acast.com'):
-                    self.logs.logging_msg(f"{prefix} self.link.startswith('https://shows.acast.com')", 'DEBUG')
-                    mp3_links = [
-                        a['content'] for a in soup.find_all('meta', content=True)
-                        if a['content'].endswith('.mp3')
-                    ]
-                elif self.link.startswith('https://feed.ausha.co') or self.link.startswith('https://podcast.ausha.co'):
-                    self.logs.logging_msg(f"{prefix} self.link.startswith('https://feed.ausha.co')", 'DEBUG')
-                    mp3_links = [
-                        a['href'] for a in soup.find_all('a', href=True)
-                        if a['href'].endswith('.mp3')
-                    ]
-                elif self.link.startswith('https://sphinx.acast.com/'):
-                    self.logs.logging_msg(f"{prefix} self.link.startswith('https://sphinx.acast.com/')", 'DEBUG')
-                    mp3_links = [self.link]
-                elif self.link.startswith('https://anchor.fm/'):
-                    self.logs.logging_msg(f"{prefix} self.link.startswith('https://anchor.fm/')", 'DEBUG')
-                    mp3_links = [self.link]
+                # direct audio links: no page to parse, the audio is only downloaded once, in streaming
+                # the audio file is kept in media_url: the page is not scraped again by the retries
+                if self.media_url:
+                    self.logs.logging_msg(f"{prefix} resolved media_url: {self.media_url}", 'DEBUG')
                 else:
-                    self.logs.logging_msg(f"{prefix} self.link.startswith: else", 'DEBUG')
-                    self.logs.logging_msg(f"{prefix} can't to parse the self.link: {self.link}", 'WARNING')
-                    mp3_links = []
-                
-                self.logs.logging_msg("a", mp3_links)
-                self.link = mp3_links[0]
+                    resolver = RESOLVERS.resolver(self.link)
+                    self.logs.logging_msg(f"{prefix} '{resolver.NAME}' resolver: {self.link}", 'DEBUG')
+                    mp3_links = resolver.audio_links(self.link, self.parse_page)
+                    if not mp3_links:
+                        self.logs.logging_msg(f"{prefix} can't to parse the self.link: {self.link}", 'WARNING')
+
+                    self.logs.logging_msg(f"{prefix} mp3_links: {mp3_links}", 'DEBUG')
+                    self.media_url = mp3_links[0]
             
             except Exception as e:
                 if '404' in str(e):
@@ -254,16 +681,87 @@ UPDATE podcasts
             if self.downloaded == 0:
                 try:
                     file_name = os.path.join(self.FOLDER_PATH, f'{self.PREFIX}{self.id}.mp3')
-                    response = requests.get(self.link)
-                    response.raise_for_status()
-                    with open(file_name, 'wb') as file:
-                        file.write(response.content)
+                    self.stream_to_file(file_name, limiter)
                     self.logs.logging_msg(f"{prefix} Podcast downloaded: {file_name}", 'DEBUG')
                     self.downloaded = 1
 
                 except Exception as e:
-                    self.logs.logging_msg(f"{prefix} Error downloading podcast: {e}", 'ERROR')
-                    self.downloaded = 2
+                    if '404' in str(e):
+                        self.logs.logging_msg(f"{prefix} Podcast link not found: {self.media_url}", 'WARNING')
+                        self.downloaded = 404
+                    else:
+                        self.logs.logging_msg(f"{prefix} Error downloading podcast: {e}", 'ERROR')
+                        self.downloaded = 2
 
         except Exception as e:
-            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
\ No newline at end of file
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+
+
+    def parse_page(self, tags=None)->BeautifulSoup:
+        response = self.http.get(self.link, timeout=self.DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        # only the tags holding the audio links are parsed
+        return BeautifulSoup(response.content, HTML_PARSER, parse_only=SoupStrainer(tags) if tags else None)
+
+
+    def stream_to_file(self, file_name, limiter=None):
+        prefix = f'[{self.__class__.__name__} | stream_to_file]'
+
+        # the audio is written by chunks in a '.part' file, kept between runs to resume the download with a Range request
+        part_file_name = f'{file_name}.part'
+        offset = os.path.getsize(part_file_name) if os.path.exists(part_file_name) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        with self.http.get(self.media_url, headers=headers, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 416:
+                # Range Not Satisfiable: the '.part' file is already complete, or is no more valid
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                if total != str(offset):
+                    os.remove(part_file_name)
+                    raise Exception(f"invalid partial file removed: {part_file_name}")
+            
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    self.logs.logging_msg(f"{prefix} Range not supported, restart the download: {self.media_url}", 'DEBUG')
+                    offset = 0
+                elif offset:
+                    self.logs.logging_msg(f"{prefix} resume the download at {offset} bytes: {self.media_url}", 'DEBUG')
+
+                with open(part_file_name, 'ab' if offset else 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        if limiter:
+                            limiter.consume(len(chunk))
+
+                content_length = response.headers.get('Content-Length')
+                if content_length and not response.headers.get('Content-Encoding') and os.path.getsize(part_file_name) != offset + int(content_length):
+                    raise Exception(f"incomplete download: {os.path.getsize(part_file_name)} / {offset + int(content_length)} bytes")
+
+            self.media_type = response.headers.get('Content-Type', self.media_type)
+
+        os.replace(part_file_name, file_name)
+        self.media_size = os.path.getsize(file_name)
+
+
+
+######################################################################################################################################################
+class BandwidthLimiter():
+    def __init__(self, rate):
+        # token bucket shared by all the download workers, rate in bytes per second
+        self.rate = rate
+        self.allowance = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def consume(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= size
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+
+        if wait:
+            time.sleep(wait)
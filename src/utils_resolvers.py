@@ -0,0 +1,113 @@
+from urllib.parse import urlparse
+
+
+######################################################################################################################################################
+class LinkResolver():
+    # generic RSS: the audio is in the <enclosure> of the entry, else the link of the entry is a page to parse
+    NAME = 'enclosure'
+    HOSTS = ()
+    AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.ogg', '.opus', '.wav')
+    # only tags of the page parsed when the audio is not in the feed
+    PAGE_TAGS = ('meta', 'a', 'audio', 'source')
+
+    def feed_link(self, entry)->str:
+        # link stored in `podcasts` for an entry of the feed, None: no usable link
+        return self.enclosure(entry) or entry.get('link')
+
+
+    def entry_links(self, entry)->list:
+        # links a previous run may have stored for the entry: its link for this resolver, then its page and enclosures (runs before the resolvers)
+        links = [self.feed_link(entry), entry.get('link')]
+        links += [enclosure.get('url') or enclosure.get('href') for enclosure in entry.get('enclosures', [])]
+        links += [link.get('href') for link in entry.get('links', [])]
+        return list(dict.fromkeys(link for link in links if link))
+
+
+    def enclosure(self, entry)->str:
+        for enclosure in entry.get('enclosures', []):
+            url = enclosure.get('url') or enclosure.get('href')
+            if url and url.startswith('https://') and (enclosure.get('type', '').startswith('audio/') or self.is_audio(url)):
+                return url
+        return None
+
+
+    def is_audio(self, link)->bool:
+        # direct audio link: downloaded without fetching and parsing a page
+        return urlparse(link).path.lower().endswith(self.AUDIO_EXTENSIONS)
+
+
+    def audio_links(self, link, parse_page)->list:
+        # parse_page: function returning the BeautifulSoup of the page of the link (PAGE_TAGS only), only called when needed
+        if self.is_audio(link):
+            return [link]
+        return self.page_links(parse_page(self.PAGE_TAGS))
+
+
+    def page_links(self, soup)->list:
+        links = [tag['content'] for tag in soup.find_all('meta', content=True)]
+        links += [tag['href'] for tag in soup.find_all('a', href=True)]
+        links += [tag['src'] for tag in soup.find_all(['audio', 'source'], src=True)]
+        return [link for link in links if self.is_audio(link)]
+
+
+######################################################################################################################################################
+class AcastResolver(LinkResolver):
+    # feeds.acast.com: audio on sphinx.acast.com, pages on shows.acast.com
+    NAME = 'acast'
+    HOSTS = ('acast.com',)
+
+    def feed_link(self, entry)->str:
+        links = [link['href'] for link in entry.get('links', []) if link.get('href')]
+        return next((link for link in links if link.startswith('https://sphinx.acast.com')), None) or self.enclosure(entry)
+
+
+    def is_audio(self, link)->bool:
+        return urlparse(link).netloc == 'sphinx.acast.com' or super().is_audio(link)
+
+
+######################################################################################################################################################
+class AushaResolver(LinkResolver):
+    # feed.ausha.co: audio enclosures, pages on podcast.ausha.co
+    NAME = 'ausha'
+    HOSTS = ('ausha.co',)
+
+
+######################################################################################################################################################
+class AnchorResolver(LinkResolver):
+    # anchor.fm: the enclosure is a redirection to the audio, without audio extension
+    NAME = 'anchor'
+    HOSTS = ('anchor.fm',)
+
+    def feed_link(self, entry)->str:
+        return next((enclosure['url'] for enclosure in entry.get('enclosures', []) if enclosure.get('url', '').startswith('https://')), None)
+
+
+    def is_audio(self, link)->bool:
+        return urlparse(link).netloc == 'anchor.fm' or super().is_audio(link)
+
+
+######################################################################################################################################################
+class Resolvers():
+    def __init__(self, resolvers=(), default=None):
+        # dispatch table {hostname: resolver}, a host is also matched by its parent domains (sphinx.acast.com > acast.com)
+        self.hosts = {}
+        self.default = default if default else LinkResolver()
+        for resolver in resolvers:
+            self.register(resolver)
+
+
+    def register(self, resolver):
+        for host in resolver.HOSTS:
+            self.hosts[host.lower()] = resolver
+
+
+    def resolver(self, url)->LinkResolver:
+        host = (urlparse(url).hostname or '').lower()
+        while host:
+            if host in self.hosts:
+                return self.hosts[host]
+            host = host.partition('.')[2]
+        return self.default
+
+
+RESOLVERS = Resolvers((AcastResolver(), AushaResolver(), AnchorResolver()))
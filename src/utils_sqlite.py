@@ -1,6 +1,18 @@
+from contextlib import contextmanager
+from functools import wraps
+import threading
 import sqlite3
+import time
 import os
-from src.utils_podcast import Podcast
+
+
+def locked(method):
+    # the shared connection is used by one thread at a time
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class PodcastDB:
@@ -9,20 +21,44 @@ class PodcastDB:
         self.logs = logs
 
         self.DEBUG = os.getenv("DEBUG")
+        self.SQLITE_BATCH_SIZE = int(os.getenv("SQLITE_BATCH_SIZE", '50'))
+        self.SQLITE_BATCH_SECONDS = float(os.getenv("SQLITE_BATCH_SECONDS", '5'))
+        self.batch_depth = 0
+        self.batch_pending = 0
+        self.batch_committed_at = time.monotonic()
+        self.SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", '30'))
+        self.SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", 'NORMAL')
+        self.SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", '16384'))
+        self.SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
 
         if self.DEBUG == '4': # debug mode for pytest
-            self.conn = sqlite3.connect('podcast_pytest.db')
+            self.db_path = 'podcast_pytest.db'
         else:
-            self.conn = sqlite3.connect('podcast.db')
+            self.db_path = 'podcast.db'
+
+        # single connection shared by the threads of the stages, one at a time (@locked)
+        self.lock = threading.RLock()
+
+        self.conn = self.connect()
         self.cursor = self.conn.cursor()
         self.init()
 
 
-    def init(self):
-        log_prefix = f'[{self.__class__.__name__} | init]'
-        
-        try:
-            self.cursor.execute("""
+    def connect(self)->sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        # WAL: the readers of other processes (reports, dashboards) are not blocked by the writes of the run
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{self.SQLITE_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size = {self.SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+
+    # schema migrations, applied in order from the version stored in PRAGMA user_version (version = index + 1)
+    MIGRATIONS = [
+        [
+            """
             CREATE TABLE IF NOT EXISTS podcasts (
                 ID INTEGER PRIMARY KEY AUTOINCREMENT,
                 category TEXT NOT NULL,
@@ -36,110 +72,305 @@ class PodcastDB:
                 transcribed INTEGER DEFAULT 0,
                 summarized INTEGER DEFAULT 0,
                 summary TEXT DEFAULT NULL
-            )""")
+            )""",
+            """
+            CREATE TABLE IF NOT EXISTS feeds (
+                rss_feed TEXT PRIMARY KEY,
+                etag TEXT DEFAULT NULL,
+                last_modified TEXT DEFAULT NULL,
+                content_hash TEXT DEFAULT NULL,
+                checked_at TEXT DEFAULT NULL
+            )""",
+        ],
+        [
+            # partial indexes: one small "work queue" per stage, the size of the pending rows and not of the history
+            "CREATE INDEX IF NOT EXISTS podcasts_to_download ON podcasts (ID) WHERE downloaded = 0",
+            "CREATE INDEX IF NOT EXISTS podcasts_to_transcribe ON podcasts (ID) WHERE downloaded = 1 AND transcribed = 0",
+            "CREATE INDEX IF NOT EXISTS podcasts_to_summarize ON podcasts (ID) WHERE downloaded = 1 AND transcribed = 1 AND summarized = 0",
+        ],
+        [
+            # failed transcriptions (2: API error, 3: no answer) retried on the next runs
+            "CREATE INDEX IF NOT EXISTS podcasts_to_transcribe_again ON podcasts (ID) WHERE downloaded = 1 AND transcribed IN (2, 3)",
+        ],
+        [
+            # transcribed segments of the long episodes, deleted once the whole text is saved
+            """
+            CREATE TABLE IF NOT EXISTS transcription_segments (
+                podcast_id INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (podcast_id, start_time, end_time)
+            )""",
+        ],
+        [
+            # failed summaries (2: API error) retried on the next runs
+            "CREATE INDEX IF NOT EXISTS podcasts_to_summarize_again ON podcasts (ID) WHERE downloaded = 1 AND transcribed = 1 AND summarized IN (2)",
+        ],
+        [
+            # usage of the OpenAI API by episode (all the requests of a map-reduce summary), cost in $
+            "ALTER TABLE podcasts ADD COLUMN prompt_tokens INTEGER DEFAULT 0",
+            "ALTER TABLE podcasts ADD COLUMN completion_tokens INTEGER DEFAULT 0",
+            "ALTER TABLE podcasts ADD COLUMN summary_cost REAL DEFAULT 0",
+        ],
+        [
+            # answers of the OpenAI API by hash of (model, role, prompt): a prompt already paid is not sent again
+            """
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                used_at TEXT DEFAULT (datetime('now'))
+            )""",
+            "CREATE INDEX IF NOT EXISTS summary_cache_used_at ON summary_cache (used_at)",
+        ],
+        [
+            # summaries sent to the OpenAI Batch API (podcasts.summarized = 4 until the batch is reconciled)
+            """
+            CREATE TABLE IF NOT EXISTS openai_batches (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT DEFAULT (datetime('now')),
+                checked_at TEXT DEFAULT NULL
+            )""",
+            """
+            CREATE TABLE IF NOT EXISTS openai_batch_requests (
+                custom_id TEXT PRIMARY KEY,
+                batch_id TEXT NOT NULL,
+                podcast_id INTEGER NOT NULL,
+                cache_key TEXT DEFAULT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS openai_batch_requests_batch_id ON openai_batch_requests (batch_id)",
+        ],
+        [
+            # audio file resolved from the link of the episode (page scraped once), failed downloads retried on the next runs
+            "ALTER TABLE podcasts ADD COLUMN media_url TEXT DEFAULT NULL",
+            "ALTER TABLE podcasts ADD COLUMN media_size INTEGER DEFAULT NULL",
+            "ALTER TABLE podcasts ADD COLUMN media_type TEXT DEFAULT NULL",
+            "CREATE INDEX IF NOT EXISTS podcasts_to_download_again ON podcasts (ID) WHERE downloaded IN (2, 3)",
+        ],
+        [
+            # links already known for a feed, read before parsing it
+            "CREATE INDEX IF NOT EXISTS podcasts_rss_feed ON podcasts (rss_feed)",
+        ],
+        [
+            # positives of the Bloom filter of the links checked on the resolved audio files too
+            "CREATE INDEX IF NOT EXISTS podcasts_media_url ON podcasts (media_url) WHERE media_url IS NOT NULL",
+        ],
+        [
+            # the old inserts escaped the values for their SQL (" stored as ''), the inserts are now parameterized
+            """
+            UPDATE OR IGNORE podcasts
+               SET link = REPLACE(link, '''''', '"')
+             WHERE link LIKE '%''''%'""",
+            """
+            UPDATE podcasts
+               SET title = REPLACE(title, '''''', '"'),
+                   published = REPLACE(published, '''''', '"'),
+                   description = REPLACE(description, '''''', '"')""",
+        ],
+        [
+            # summaries in an OpenAI batch (summarized = 4), read at each run to reconcile the batches
+            "CREATE INDEX IF NOT EXISTS podcasts_in_batch ON podcasts (ID) WHERE summarized IN (4)",
+        ],
+    ]
+
+
+    @locked
+    def init(self):
+        log_prefix = f'[{self.__class__.__name__} | init]'
+        
+        try:
+            self.cursor.execute("PRAGMA user_version")
+            version = self.cursor.fetchone()[0]
+
+            for version, migration in enumerate(self.MIGRATIONS[version:], start=version + 1):
+                try:
+                    self.cursor.execute("BEGIN")
+                    for request in migration:
+                        self.logs.logging_msg(f"{log_prefix} request: {request}", 'SQL')
+                        self.cursor.execute(request)
+                    self.cursor.execute(f"PRAGMA user_version = {version}")
+                    self.conn.commit()
+                    self.logs.logging_msg(f"{log_prefix} migration to version {version}", 'DEBUG')
 
-            self.logs.logging_msg(f"{log_prefix} CREATE TABLE `podcasts`", 'DEBUG')
+                except Exception:
+                    self.conn.rollback()
+                    raise
         
         except Exception as e:
             self.status = f"{log_prefix} Error: {e}"
             self.logs.logging_msg(self.status, 'ERROR')
 
 
-    def insert_podcast(self, category, podcast_name, rss_feed, title, link, published, description):
-        prefix = f'[{self.__class__.__name__} | insert_podcast]'
+    def insert_podcast(self, category, podcast_name, rss_feed, title, link, published, description)->bool:
+        return self.insert_podcasts([(category, podcast_name, rss_feed, title, link, published, description)])['inserted'] == 1
+
+
+    @locked
+    def insert_podcasts(self, podcasts: list)->dict:
+        prefix = f'[{self.__class__.__name__} | insert_podcasts]'
         
+        # podcasts: list of (category, podcast_name, rss_feed, title, link, published, description)
+        # failed: podcasts not saved (error, transaction rolled back), to be parsed again on the next run
+        result = {'inserted': 0, 'skipped': 0, 'failed': 0}
+
         try:
-            request = f'''
+            request = '''
 INSERT INTO podcasts (category, podcast_name, rss_feed, title, link, published, description)
-     VALUES ("{category}", "{podcast_name}", "{rss_feed}", "{title}", "{link}", "{published}", "{description}")
+     VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(link) DO NOTHING
 '''
             self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
-            self.cursor.execute(request)
-            self.conn.commit()
+            with self.conn: # one transaction for the whole feed
+                self.cursor.executemany(request, podcasts)
+                result['inserted'] = max(self.cursor.rowcount, 0)
 
-            self.logs.logging_msg(f"{prefix} podcast saved in 'podcast.db'", 'DEBUG')
+            result['skipped'] = len(podcasts) - result['inserted']
+            self.logs.logging_msg(f"{prefix} {result['inserted']} podcasts saved in 'podcast.db', {result['skipped']} already exist", 'DEBUG')
 
         except Exception as e:
-            if 'UNIQUE constraint' in str(e):
-                self.logs.logging_msg(f"{prefix} Podcast already exists", 'DEBUG')
-            else:
-                self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            result['inserted'] = 0
+            result['failed'] = len(podcasts)
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+
+        return result
+    
+
+    @locked
+    def feed_links(self, rss_feed: str)->set:
+        prefix = f'[{self.__class__.__name__} | feed_links]'
+
+        # links of the episodes of the feed already saved, and their resolved audio files
+        try:
+            self.cursor.execute("SELECT link, media_url FROM podcasts WHERE rss_feed = ?", (rss_feed,))
+            links = set()
+            for link, media_url in self.cursor:
+                links.add(link)
+                if media_url:
+                    links.add(media_url)
+            return links
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return set()
+
+
+    @locked
+    def feed_published(self, rss_feed: str)->list:
+        prefix = f'[{self.__class__.__name__} | feed_published]'
+
+        # publication dates (as in the feed) of all the episodes saved: a back catalogue is inserted newest first,
+        # the order of the IDs is not the order of publication and the dates can only be sorted once parsed
+        try:
+            self.cursor.execute("SELECT published FROM podcasts WHERE rss_feed = ?", (rss_feed,))
+            return [row[0] for row in self.cursor.fetchall()]
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return []
+
+
+    def iter_links(self, batch_size: int = 1000):
+        prefix = f'[{self.__class__.__name__} | iter_links]'
+
+        # links of all the episodes and their resolved audio files, read by batches
+        try:
+            with self.lock:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT link, media_url FROM podcasts")
+
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for link, media_url in rows:
+                    yield link
+                    if media_url:
+                        yield media_url
+
+            cursor.close()
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+
+
+    @locked
+    def link_exists(self, link: str)->bool:
+        prefix = f'[{self.__class__.__name__} | link_exists]'
+
+        try:
+            self.cursor.execute("SELECT 1 FROM podcasts WHERE link = ? OR media_url = ? LIMIT 1", (link, link))
+            return self.cursor.fetchone() is not None
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    def where(self, downloaded: bool = None, transcribed: bool = None, summarized: bool = None)->str:
+        # True: = 1, False: = 0, None: no filter, tuple of statuses: IN (...)
+        conditions = ''
+        for column, value in (('downloaded', downloaded), ('transcribed', transcribed), ('summarized', summarized)):
+            if value is True:
+                conditions += f'\n   AND {column} = 1'
+            elif value is False:
+                conditions += f'\n   AND {column} = 0'
+            elif value is not None:
+                conditions += f'\n   AND {column} IN ({", ".join(str(int(status)) for status in value)})'
+
+        return f'''
+ WHERE 1 = 1{conditions}
+'''
     
 
     def podcasts(self, downloaded: bool = None, transcribed: bool = None, summarized: bool = None)->list:
-        prefix = f'[{self.__class__.__name__} | podcasts]'
+        return list(self.iter_podcasts(downloaded, transcribed, summarized))
+
 
-        if downloaded is True:  downloaded_txt = '   AND downloaded = 1'
-        if downloaded is False: downloaded_txt = '   AND downloaded = 0'
-        if downloaded is None:  downloaded_txt = ''
-        if transcribed is True:   transcribed_txt = '   AND transcribed = 1'
-        if transcribed is False:  transcribed_txt = '   AND transcribed = 0'
-        if transcribed is None:   transcribed_txt = ''
-        if summarized is True:   summarized_txt = '   AND summarized = 1'
-        if summarized is False:  summarized_txt = '   AND summarized = 0'
-        if summarized is None:   summarized_txt = ''
+    def iter_podcasts(self, downloaded: bool = None, transcribed: bool = None, summarized: bool = None, batch_size: int = 100):
+        prefix = f'[{self.__class__.__name__} | iter_podcasts]'
 
         try:
             request = f'''
 SELECT *
-  FROM podcasts
- WHERE 1 = 1
-{downloaded_txt}
-{transcribed_txt}
-{summarized_txt}
+  FROM podcasts{self.where(downloaded, transcribed, summarized)}
+ ORDER BY ID
 '''
             self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
-            self.cursor.execute(request)
+            # own cursor: the rows can be updated with self.cursor during the iteration
+            with self.lock:
+                cursor = self.conn.cursor()
+                cursor.execute(request)
 
-            podcasts = []
-            for row in self.cursor.fetchall():
-                podcast = Podcast(
-                    self.logs,
-                    self,
-                    row[0],
-                    row[1],
-                    row[2],
-                    row[3],
-                    row[4],
-                    row[5],
-                    row[6],
-                    row[7],
-                    row[8],
-                    row[9],
-                    row[10],
-                    row[11]
-                )
-                podcasts.append(podcast)
-            
-            return podcasts
+            # imported at the first iteration: the runs without pending work do not load the stages and their libraries
+            from src.utils_podcast import Podcast
+
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield Podcast(self.logs, self, *row)
+
+            cursor.close()
 
         except Exception as e:
             self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
-            return []
 
 
+    @locked
     def count_podcasts(self, downloaded: bool = None, transcribed: bool = None, summarized: bool = None)->int:
         prefix = f'[{self.__class__.__name__} | count_podcasts]'
-
-        if downloaded is True:  downloaded_txt = '   AND downloaded = 1'
-        if downloaded is False: downloaded_txt = '   AND downloaded = 0'
-        if downloaded is None:  downloaded_txt = ''
-        if transcribed is True:   transcribed_txt = '   AND transcribed = 1'
-        if transcribed is False:  transcribed_txt = '   AND transcribed = 0'
-        if transcribed is None:   transcribed_txt = ''
-        if summarized is True:   summarized_txt = '   AND summarized = 1'
-        if summarized is False:  summarized_txt = '   AND summarized = 0'
-        if summarized is None:   summarized_txt = ''
         
         try:
             request = f'''
 SELECT COUNT(1)
-  FROM podcasts
- WHERE 1 = 1
-{downloaded_txt}
-{transcribed_txt}
-{summarized_txt}
-'''
+  FROM podcasts{self.where(downloaded, transcribed, summarized)}'''
             self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
             self.cursor.execute(request)
             count = self.cursor.fetchone()[0]
@@ -151,13 +382,14 @@ SELECT COUNT(1)
             return 0
         
 
-    def update_podcast(self, request: str)->bool:
+    @locked
+    def update_podcast(self, request: str, params: tuple = ())->bool:
         prefix = f'[{self.__class__.__name__} | update_podcast]'
         
         try:
             self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
-            self.cursor.execute(request)
-            self.conn.commit()
+            self.cursor.execute(request, params)
+            self.commit()
             self.logs.logging_msg(f"{prefix} podcast updated in 'podcast.db'", 'DEBUG')
 
             return True
@@ -167,6 +399,259 @@ SELECT COUNT(1)
             return False
 
 
-    def logout(self):
+    def update_podcast_columns(self, id: int, columns: dict)->bool:
+        # columns: {column: value}, only these columns are written
+        request = f'''
+UPDATE podcasts
+   SET {", ".join(f"{column} = ?" for column in columns)}
+ WHERE ID = ?
+'''
+        return self.update_podcast(request, (*columns.values(), id))
+
+
+    @contextmanager
+    def batch(self):
+        # the commits are grouped: every SQLITE_BATCH_SIZE updates, or at the first update SQLITE_BATCH_SECONDS after the last commit
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.commit()
+
+
+    @locked
+    def commit(self):
+        if self.batch_depth:
+            self.batch_pending += 1
+            if self.batch_pending < self.SQLITE_BATCH_SIZE and time.monotonic() - self.batch_committed_at < self.SQLITE_BATCH_SECONDS:
+                return
+
         self.conn.commit()
-        self.conn.close()
\ No newline at end of file
+        self.batch_pending = 0
+        self.batch_committed_at = time.monotonic()
+
+
+    @locked
+    def transcription_segments(self, podcast_id: int)->dict:
+        prefix = f'[{self.__class__.__name__} | transcription_segments]'
+
+        try:
+            self.cursor.execute("SELECT start_time, end_time, text FROM transcription_segments WHERE podcast_id = ?", (podcast_id,))
+            return {(row[0], row[1]): row[2] for row in self.cursor.fetchall()}
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return {}
+
+
+    @locked
+    def save_transcription_segment(self, podcast_id: int, start_time: float, end_time: float, text: str)->bool:
+        prefix = f'[{self.__class__.__name__} | save_transcription_segment]'
+
+        try:
+            # committed at once: a crash resumes from the last transcribed segment
+            self.cursor.execute("INSERT OR REPLACE INTO transcription_segments (podcast_id, start_time, end_time, text) VALUES (?, ?, ?, ?)", (podcast_id, start_time, end_time, text))
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    @locked
+    def delete_transcription_segments(self, podcast_id: int)->bool:
+        prefix = f'[{self.__class__.__name__} | delete_transcription_segments]'
+
+        try:
+            self.cursor.execute("DELETE FROM transcription_segments WHERE podcast_id = ?", (podcast_id,))
+            self.commit()
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    @locked
+    def feed_cache(self, rss_feed: str)->dict:
+        prefix = f'[{self.__class__.__name__} | feed_cache]'
+
+        try:
+            self.cursor.execute("SELECT etag, last_modified, content_hash, checked_at FROM feeds WHERE rss_feed = ?", (rss_feed,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return {}
+            return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2], 'checked_at': row[3]}
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return {}
+
+
+    @locked
+    def update_feed_cache(self, rss_feed: str, etag: str = None, last_modified: str = None, content_hash: str = None)->bool:
+        prefix = f'[{self.__class__.__name__} | update_feed_cache]'
+
+        try:
+            # without etag, last_modified and content_hash (304 Not Modified) only the check date is refreshed
+            # a streamed feed left early has its validators but no content_hash: the last hash is kept
+            request = '''
+INSERT INTO feeds (rss_feed, etag, last_modified, content_hash, checked_at)
+     VALUES (?, ?, ?, ?, datetime('now'))
+ON CONFLICT(rss_feed) DO UPDATE
+        SET etag = CASE WHEN COALESCE(excluded.etag, excluded.last_modified, excluded.content_hash) IS NULL THEN etag ELSE excluded.etag END,
+            last_modified = CASE WHEN COALESCE(excluded.etag, excluded.last_modified, excluded.content_hash) IS NULL THEN last_modified ELSE excluded.last_modified END,
+            content_hash = COALESCE(excluded.content_hash, content_hash),
+            checked_at = excluded.checked_at
+'''
+            self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
+            self.cursor.execute(request, (rss_feed, etag, last_modified, content_hash))
+            self.commit()
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    @locked
+    def summary_cache(self, key: str)->dict:
+        prefix = f'[{self.__class__.__name__} | summary_cache]'
+
+        try:
+            self.cursor.execute("SELECT summary, prompt_tokens, completion_tokens FROM summary_cache WHERE key = ?", (key,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return {}
+
+            # the entries used recently are the last ones evicted
+            self.cursor.execute("UPDATE summary_cache SET used_at = datetime('now') WHERE key = ?", (key,))
+            self.commit()
+            return {'summary': row[0], 'prompt_tokens': row[1], 'completion_tokens': row[2]}
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return {}
+
+
+    @locked
+    def update_summary_cache(self, key: str, summary: str, prompt_tokens: int, completion_tokens: int)->bool:
+        prefix = f'[{self.__class__.__name__} | update_summary_cache]'
+
+        try:
+            request = '''
+INSERT OR REPLACE INTO summary_cache (key, summary, prompt_tokens, completion_tokens)
+     VALUES (?, ?, ?, ?)
+'''
+            self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
+            self.cursor.execute(request, (key, summary, prompt_tokens, completion_tokens))
+            self.commit()
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    @locked
+    def evict_summary_cache(self, max_age_days: int, max_entries: int)->int:
+        prefix = f'[{self.__class__.__name__} | evict_summary_cache]'
+
+        # entries not used for max_age_days, then the least recently used ones over max_entries (0: no limit)
+        try:
+            evicted = 0
+            with self.conn:
+                if max_age_days > 0:
+                    self.cursor.execute("DELETE FROM summary_cache WHERE used_at < datetime('now', ?)", (f'-{max_age_days} days',))
+                    evicted += self.cursor.rowcount
+                if max_entries > 0:
+                    request = '''
+DELETE FROM summary_cache
+ WHERE key IN (SELECT key
+                 FROM summary_cache
+                ORDER BY used_at DESC
+                LIMIT -1 OFFSET ?)
+'''
+                    self.logs.logging_msg(f"{prefix} request: {request}", 'SQL')
+                    self.cursor.execute(request, (max_entries,))
+                    evicted += self.cursor.rowcount
+
+            self.logs.logging_msg(f"{prefix} {evicted} entries evicted", 'DEBUG')
+            return evicted
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return 0
+
+
+    @locked
+    def save_openai_batch(self, batch_id: str, status: str, batch_requests: list)->bool:
+        prefix = f'[{self.__class__.__name__} | save_openai_batch]'
+
+        # batch_requests: list of (custom_id, podcast_id, cache_key)
+        try:
+            with self.conn:
+                self.cursor.execute("INSERT OR REPLACE INTO openai_batches (id, status) VALUES (?, ?)", (batch_id, status))
+                self.cursor.executemany(
+                    "INSERT OR REPLACE INTO openai_batch_requests (custom_id, batch_id, podcast_id, cache_key) VALUES (?, ?, ?, ?)",
+                    [(custom_id, batch_id, podcast_id, cache_key) for custom_id, podcast_id, cache_key in batch_requests]
+                )
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    @locked
+    def openai_batches(self, done_statuses: tuple = ())->list:
+        prefix = f'[{self.__class__.__name__} | openai_batches]'
+
+        # ids of the batches not in one of done_statuses
+        try:
+            request = f"SELECT id FROM openai_batches WHERE status NOT IN ({', '.join('?' for _ in done_statuses) or 'NULL'}) ORDER BY created_at"
+            self.cursor.execute(request, done_statuses)
+            return [row[0] for row in self.cursor.fetchall()]
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return []
+
+
+    @locked
+    def openai_batch_requests(self, batch_id: str)->dict:
+        prefix = f'[{self.__class__.__name__} | openai_batch_requests]'
+
+        # {podcast_id: (custom_id, cache_key)}
+        try:
+            self.cursor.execute("SELECT custom_id, podcast_id, cache_key FROM openai_batch_requests WHERE batch_id = ?", (batch_id,))
+            return {row[1]: (row[0], row[2]) for row in self.cursor.fetchall()}
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return {}
+
+
+    @locked
+    def update_openai_batch(self, batch_id: str, status: str)->bool:
+        prefix = f'[{self.__class__.__name__} | update_openai_batch]'
+
+        try:
+            self.cursor.execute("UPDATE openai_batches SET status = ?, checked_at = datetime('now') WHERE id = ?", (status, batch_id))
+            self.commit()
+            return True
+
+        except Exception as e:
+            self.logs.logging_msg(f"{prefix} Error: {e}", 'WARNING')
+            return False
+
+
+    def logout(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import threading
+import asyncio
+import os
+
+
+######################################################################################################################################################
+class WhisperDispatcher:
+    def __init__(self, logs, http):
+        self.logs = logs
+        self.http = http
+
+        self.WHISPER_URLS = [url.strip() for url in os.getenv("WHISPER_URLS", 'http://127.0.0.1:9000/transcribe/').split(',') if url.strip()]
+        self.WHISPER_JOBS_PER_BACKEND = int(os.getenv("WHISPER_JOBS_PER_BACKEND", '1'))
+        self.WHISPER_TIMEOUT = float(os.getenv("WHISPER_TIMEOUT", '3600'))
+        self.WHISPER_RETRIES = int(os.getenv("WHISPER_RETRIES", '1'))
+        self.WHISPER_RETRY_DELAY = float(os.getenv("WHISPER_RETRY_DELAY", '2'))
+
+        self.backends = [{'url': url, 'in_flight': 0, 'jobs': 0} for url in self.WHISPER_URLS]
+        self.capacity = len(self.backends) * self.WHISPER_JOBS_PER_BACKEND
+
+        # one event loop in its own thread: the jobs can be submitted from the stage loop and from the pipeline workers
+        self.loop = None
+        self.thread = None
+        self.condition = None
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='WhisperDispatcher', daemon=True)
+                self.thread.start()
+                self.condition = asyncio.run_coroutine_threadsafe(self.create_condition(), self.loop).result()
+
+
+    async def create_condition(self)->asyncio.Condition:
+        return asyncio.Condition()
+
+
+    def submit(self, file_path):
+        # returns a concurrent.futures.Future of (transcribed status, response data)
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.transcribe_async(file_path), self.loop)
+
+
+    def submit_segments(self, file_paths, callback=None):
+        # all the segments of an episode in parallel: Future of [(transcribed status, response data)] in the segments order
+        # callback(index, status, response_data) is called (in the dispatcher thread) as soon as a segment is done
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.transcribe_segments_async(file_paths, callback), self.loop)
+
+
+    async def transcribe_segments_async(self, file_paths, callback=None)->list:
+        async def transcribe_segment(index, file_path):
+            status, response_data = await self.transcribe_async(file_path)
+            if callback:
+                callback(index, status, response_data)
+            return status, response_data
+
+        return await asyncio.gather(*(transcribe_segment(index, file_path) for index, file_path in enumerate(file_paths)))
+
+
+    def transcribe(self, file_path)->tuple:
+        return self.submit(file_path).result()
+
+
+    async def acquire_backend(self)->dict:
+        # least-loaded routing: the free backend with the fewest jobs in flight
+        async with self.condition:
+            await self.condition.wait_for(lambda: any(backend['in_flight'] < self.WHISPER_JOBS_PER_BACKEND for backend in self.backends))
+            backend = min(
+                (backend for backend in self.backends if backend['in_flight'] < self.WHISPER_JOBS_PER_BACKEND),
+                key=lambda backend: (backend['in_flight'], backend['jobs'])
+            )
+            backend['in_flight'] += 1
+            backend['jobs'] += 1
+            return backend
+
+
+    async def release_backend(self, backend):
+        async with self.condition:
+            backend['in_flight'] -= 1
+            self.condition.notify_all()
+
+
+    async def transcribe_async(self, file_path)->tuple:
+        prefix = f'[{self.__class__.__name__} | transcribe_async]'
+
+        for attempt in range(self.WHISPER_RETRIES + 1):
+            backend = await self.acquire_backend()
+            try:
+                # timeout of the HTTP request itself: the backend is only released once the request has returned
+                response = await asyncio.to_thread(self.http.post, backend['url'], params={'file_path': file_path}, timeout=self.WHISPER_TIMEOUT)
+                response_data = response.json()
+
+                if response.status_code == 200:
+                    self.logs.logging_msg(f"{prefix} [API status:{response.status_code}] {backend['url']}: {file_path}", 'DEBUG')
+                    return 1, response_data
+                status = 2
+                self.logs.logging_msg(f"{prefix} [API status:{response.status_code}] {backend['url']}: {file_path} failed with error: {response_data.get('error', 'Unknown error')}", 'WARNING')
+
+            except Exception as e:
+                status = 3
+                response_data = {'error': str(e) or e.__class__.__name__}
+                self.logs.logging_msg(f"{prefix} {backend['url']}: {file_path} Error: {response_data['error']}", 'WARNING')
+
+            finally:
+                await self.release_backend(backend)
+
+            if attempt < self.WHISPER_RETRIES:
+                await asyncio.sleep(self.WHISPER_RETRY_DELAY * 2 ** attempt)
+
+        return status, response_data
+
+
+    @staticmethod
+    def stitch(texts, max_overlap_words=50)->str:
+        # texts of overlapping segments: the words repeated at the start of a segment are dropped
+        def normalize(word):
+            return ''.join(char for char in word.lower() if char.isalnum())
+
+        words = []
+        for text in texts:
+            next_words = text.split()
+            tail = [normalize(word) for word in words[-max_overlap_words:]]
+            head = [normalize(word) for word in next_words[:max_overlap_words]]
+
+            overlap = 0
+            for size in range(min(len(tail), len(head)), 1, -1):
+                if tail[-size:] == head[:size]:
+                    overlap = size
+                    break
+            words.extend(next_words[overlap:])
+
+        return ' '.join(words)
+
+
+    def stop(self):
+        with self.lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.thread.join()
+                self.loop.close()
+                self.loop = None
+                self.thread = None
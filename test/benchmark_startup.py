@@ -0,0 +1,56 @@
+import subprocess
+import statistics
+import tempfile
+import sys
+import time
+import os
+
+
+# startup time of a run without work (no feed due, no episode pending), lazy imports vs all the stages imported at startup
+# python test/benchmark_startup.py [runs]
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+HEAVY_MODULES = ('openai', 'bs4', 'feedparser', 'requests')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    'eager': "import src.utils_podcast, src.utils_parse_rss, src.utils_pipeline, src.utils_daemon\n",
+    'lazy': "",
+}
+# each run in its own temporary directory: empty database (podcast.db of the cwd), no feed, no daemon
+ENV = {'DEBUG': '0', 'DAEMON': '0', 'LOGS_PATH': './logs/', 'RSS_FEEDS': 'feeds.json', 'PIPELINE_MODE': 'stages'}
+RUN = '''
+import sys, os
+import src.main # loads the .env of the repository (override): the settings of the benchmark come after it
+os.environ.update({env!r})
+src.main.main(['all'])
+print('HEAVY', ','.join(module for module in {modules!r} if module in sys.modules))
+'''.format(env=ENV, modules=HEAVY_MODULES)
+
+
+def measure(code)->tuple:
+    durations = []
+    heavy = ''
+    for _ in range(RUNS):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, ENV['RSS_FEEDS']), 'w', encoding='utf-8') as file:
+                file.write('[]')
+
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-c', code],
+                cwd=tmpdir,
+                env=dict(os.environ, PYTHONPATH=ROOT),
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout
+            durations.append(time.perf_counter() - start)
+        heavy = next((line.split(' ', 1)[1] for line in output.splitlines() if line.startswith('HEAVY')), '')
+    return statistics.median(durations), heavy
+
+
+if __name__ == "__main__":
+    results = {name: measure(imports + RUN) for name, imports in CASES.items()}
+    for name, (duration, heavy) in results.items():
+        print(f"{name:>5}: {duration * 1000:7.1f} ms (median of {RUNS} runs), heavy modules loaded: {heavy or 'none'}")
+    print(f"startup: -{(1 - results['lazy'][0] / results['eager'][0]):.0%}")
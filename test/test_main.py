@@ -1,6 +1,8 @@
 import pytest
 import dotenv
 import os
+import sys
+import subprocess
 from src.main import main
 
 
@@ -13,4 +15,23 @@ def test_main():
         assert main() == True
     
     else:
-        assert False
\ No newline at end of file
+        assert False
+
+def test_main_lazy_imports(tmp_path):
+    if DEBUG == '4':
+        # a whole run with nothing pending (empty database of the temporary directory, no feed): the stages and their libraries are not loaded
+        # the settings are set after the .env loaded by src.main
+        code = """
+import sys, os
+import src.main
+os.environ.update({'DEBUG': '4', 'DAEMON': '0', 'LOGS_PATH': './logs/', 'PIPELINE_MODE': 'stages'})
+assert src.main.main(['all'])
+print('LOADED', [module for module in ('openai', 'bs4', 'feedparser', 'requests', 'src.utils_podcast') if module in sys.modules])
+"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=dict(os.environ, PYTHONPATH=root), capture_output=True, text=True, check=True).stdout
+        assert (tmp_path / 'podcast_pytest.db').exists()
+        assert 'LOADED []' in output.splitlines()
+    
+    else:
+        assert False
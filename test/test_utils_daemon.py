@@ -0,0 +1,101 @@
+import pytest
+import dotenv
+import os
+import json
+import signal
+import socket
+import urllib.error
+import urllib.request
+from src.logs import Logs
+from src.utils_daemon import Daemon
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+logs = Logs()
+
+
+def test_daemon(monkeypatch):
+    if DEBUG == '4':
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        monkeypatch.setenv('DAEMON_PORT', str(port))
+
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, getattr(signal, 'SIGHUP', signal.SIGTERM))}
+        daemon = Daemon(logs)
+        try:
+            # "poll now" wakes the daemon before the delay
+            request = urllib.request.Request(f'http://127.0.0.1:{port}/poll', method='POST')
+            assert urllib.request.urlopen(request).status == 202
+            assert daemon.wait(60) == True
+            assert daemon.take_poll() == True
+            assert daemon.take_poll() == False
+
+            status = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{port}/status').read())
+            assert status['cycles'] == 1
+
+            daemon.reload()
+            assert daemon.wait(60) == True
+            assert daemon.take_reload() == True
+
+            daemon.stop()
+            assert daemon.wait(60) == False
+
+        finally:
+            daemon.close()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+    
+    else:
+        assert False
+
+
+def test_daemon_origin(monkeypatch):
+    if DEBUG == '4':
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        monkeypatch.setenv('DAEMON_PORT', str(port))
+
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, getattr(signal, 'SIGHUP', signal.SIGTERM))}
+        daemon = Daemon(logs)
+        try:
+            # cross-origin post of a web page: refused, the daemon keeps running
+            request = urllib.request.Request(f'http://127.0.0.1:{port}/stop', method='POST', headers={'Origin': 'http://example.com'})
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(request)
+            assert error.value.code == 403
+            assert daemon.stopping == False
+
+        finally:
+            daemon.close()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+    
+    else:
+        assert False
+
+
+def test_daemon_port_in_use(monkeypatch):
+    if DEBUG == '4':
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            sock.listen()
+            monkeypatch.setenv('DAEMON_PORT', str(sock.getsockname()[1]))
+
+            handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, getattr(signal, 'SIGHUP', signal.SIGTERM))}
+            daemon = Daemon(logs)
+            try:
+                # no endpoint, the daemon still runs on the signals
+                assert daemon.server is None
+                daemon.stop()
+                assert daemon.wait(60) == False
+
+            finally:
+                daemon.close()
+                for signum, handler in handlers.items():
+                    signal.signal(signum, handler)
+    
+    else:
+        assert False
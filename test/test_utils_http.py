@@ -0,0 +1,57 @@
+import pytest
+import dotenv
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.logs import Logs
+from src.utils_http import HttpClient
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+logs = Logs()
+http = HttpClient(logs)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: the connection stays open between two requests
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_stats():
+    if DEBUG == '4':
+        assert http.stats() == {'requests': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
+    
+    else:
+        assert False
+
+
+def test_stats_pool():
+    if DEBUG == '4':
+        server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = HttpClient(logs)
+
+        try:
+            # first request: new connection (miss), second one: kept-alive connection of the pool (hit)
+            for _ in range(2):
+                response = client.get(f'http://127.0.0.1:{server.server_port}/')
+                assert response.content == b'ok'
+            assert client.stats() == {'requests': 2, 'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+    
+    else:
+        assert False
@@ -0,0 +1,28 @@
+import pytest
+import dotenv
+import os
+from src.utils_mp3 import MP3Splitter
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+
+
+def test_split(tmp_path):
+    if DEBUG == '4':
+        splitter = MP3Splitter('./test/example.mp3')
+        duration = splitter.scan()
+        segments = splitter.segments(60, 5)
+
+        assert 149 < duration < 150
+        assert segments == [(0, 60), (55, 115), (110, duration)]
+
+        splitter.write(55, 115, tmp_path / 'example_55s.mp3')
+        assert 59 < MP3Splitter(tmp_path / 'example_55s.mp3').scan() < 61
+
+        # last segment: up to the last frame
+        splitter.write(110, duration, tmp_path / 'example_110s.mp3')
+        assert MP3Splitter(tmp_path / 'example_110s.mp3').scan() == pytest.approx(duration - 110, abs=0.05)
+    
+    else:
+        assert False
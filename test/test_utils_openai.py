@@ -0,0 +1,259 @@
+import pytest
+import dotenv
+import os
+import json
+import time
+import threading
+import openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.logs import Logs
+from src.utils_sqlite import PodcastDB
+from src.utils_openai import OpenAIClient, RateLimiter, SummaryCache, Prompts
+from src.utils_podcast import Podcasts
+from types import SimpleNamespace
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+logs = Logs()
+client = OpenAIClient(logs, 'key')
+
+
+class OpenAIStub(BaseHTTPRequestHandler):
+    # answers of the fake API, one per request
+    responses = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        status, body = self.responses.pop(0)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write((body if isinstance(body, str) else json.dumps(body)).encode())
+
+    def do_GET(self):
+        status, body = self.responses.pop(0)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write((body if isinstance(body, str) else json.dumps(body)).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), OpenAIStub)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+client.OPENAI_BASE_URL = f'http://127.0.0.1:{server.server_port}/v1'
+client.OPENAI_BACKOFF = 0.1
+
+
+def test_rate_limiter():
+    if DEBUG == '4':
+        limiter = RateLimiter(600) # 10 per second, bursts up to 600
+        start = time.monotonic()
+        limiter.consume(600)
+        assert time.monotonic() - start < 0.1
+
+        limiter.consume(5)
+        assert time.monotonic() - start >= 0.4
+    
+    else:
+        assert False
+
+
+def test_backoff():
+    if DEBUG == '4':
+        backoff = OpenAIClient(logs, 'key')
+        backoff.OPENAI_BACKOFF = 1
+        assert 4 <= backoff.backoff(3) <= 8
+        assert backoff.backoff(10) <= backoff.OPENAI_BACKOFF_MAX
+
+        error = openai.error.RateLimitError('rate limited', headers={'retry-after': '20'})
+        assert backoff.backoff(0, error) == 20
+    
+    else:
+        assert False
+
+
+def test_chat_retry():
+    if DEBUG == '4':
+        OpenAIStub.responses = [
+            (429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}}),
+            (200, {'choices': [{'message': {'role': 'assistant', 'content': 'summary'}}], 'usage': {'prompt_tokens': 30, 'completion_tokens': 12}}),
+        ]
+        assert client.chat('role', 'prompt') == ('summary', {'prompt_tokens': 30, 'completion_tokens': 12})
+        assert client.retries == 1
+        assert client.rate_limited == 1
+        assert client.tokens == 42
+        assert client.spent == client.cost({'prompt_tokens': 30, 'completion_tokens': 12})
+    
+    else:
+        assert False
+
+
+def test_chat_no_retry():
+    if DEBUG == '4':
+        OpenAIStub.responses = [(401, {'error': {'message': 'Incorrect API key provided', 'type': 'invalid_request_error'}})]
+        requests_before = client.requests
+
+        # an authentication error is not retried
+        with pytest.raises(openai.error.AuthenticationError):
+            client.chat('role', 'prompt')
+        assert client.requests == requests_before + 1
+    
+    else:
+        assert False
+
+
+def test_split():
+    if DEBUG == '4':
+        text = ' '.join(f'word{i}' for i in range(2000))
+        chunks = client.split(text, 500)
+
+        assert len(chunks) > 1
+        assert ''.join(chunks) == text
+        assert all(client.count_tokens(chunk) <= 510 for chunk in chunks)
+    
+    else:
+        assert False
+
+
+def test_summary_cache():
+    if DEBUG == '4':
+        podcastdb = PodcastDB(logs)
+        cache = SummaryCache(logs, podcastdb)
+        cached_client = OpenAIClient(logs, 'key', cache)
+        cached_client.OPENAI_BASE_URL = client.OPENAI_BASE_URL
+
+        OpenAIStub.responses = [(200, {'choices': [{'message': {'role': 'assistant', 'content': 'cached summary'}}], 'usage': {'prompt_tokens': 30, 'completion_tokens': 12}})]
+        prompt = f'test_summary_cache {time.time()}'
+        assert cached_client.chat('role', prompt) == ('cached summary', {'prompt_tokens': 30, 'completion_tokens': 12})
+        # same model, role and prompt: no request
+        assert cached_client.chat('role', prompt) == ('cached summary', {'prompt_tokens': 30, 'completion_tokens': 12, 'cached': True})
+        assert cached_client.billed_cost([{'prompt_tokens': 30, 'completion_tokens': 12, 'cached': True}]) == 0.0
+        assert cached_client.requests == 1
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'saved_tokens': 42}
+
+        podcastdb.evict_summary_cache(0, 1)
+        podcastdb.cursor.execute("SELECT COUNT(1) FROM summary_cache")
+        assert podcastdb.cursor.fetchone()[0] == 1
+    
+    else:
+        assert False
+
+
+def test_batch():
+    if DEBUG == '4':
+        podcastdb = PodcastDB(logs)
+        batch_id = f'batch_{time.time()}'
+        OpenAIStub.responses = [
+            (200, {'id': 'file_input', 'purpose': 'batch'}),
+            (200, {'id': batch_id, 'status': 'validating'}),
+            (200, {'id': batch_id, 'status': 'completed', 'output_file_id': 'file_output'}),
+            (200, '\n'.join([
+                json.dumps({'custom_id': 'podcast-1', 'response': {'status_code': 200, 'body': {'choices': [{'message': {'role': 'assistant', 'content': 'batch summary'}}], 'usage': {'prompt_tokens': 30, 'completion_tokens': 12}}}}),
+                json.dumps({'custom_id': 'podcast-2', 'response': {'status_code': 400, 'body': {'error': {'message': 'bad request'}}}}),
+            ])),
+        ]
+
+        response = client.submit_batch([client.batch_request('podcast-1', 'role', 'prompt'), client.batch_request('podcast-2', 'role', 'prompt')])
+        assert response['id'] == batch_id
+        podcastdb.save_openai_batch(batch_id, response['status'], [('podcast-1', 1, None), ('podcast-2', 2, 'key')])
+        assert batch_id in podcastdb.openai_batches(client.BATCH_DONE)
+
+        response = client.retrieve_batch(batch_id)
+        assert response['status'] in client.BATCH_DONE
+        assert client.batch_results(response['output_file_id']) == {'podcast-1': ('batch summary', {'prompt_tokens': 30, 'completion_tokens': 12}), 'podcast-2': None}
+        assert podcastdb.openai_batch_requests(batch_id) == {1: ('podcast-1', None), 2: ('podcast-2', 'key')}
+
+        podcastdb.update_openai_batch(batch_id, response['status'])
+        assert batch_id not in podcastdb.openai_batches(client.BATCH_DONE)
+        assert client.cost({'prompt_tokens': 30, 'completion_tokens': 12}, client.OPENAI_BATCH_PRICE_FACTOR) == pytest.approx(client.cost({'prompt_tokens': 30, 'completion_tokens': 12}) * client.OPENAI_BATCH_PRICE_FACTOR)
+    
+    else:
+        assert False
+
+
+def test_summarize_batch(tmp_path, monkeypatch):
+    if DEBUG == '4':
+        # empty database and transcriptions of the temporary directory
+        monkeypatch.chdir(tmp_path)
+        podcastdb = PodcastDB(logs)
+        podcasts = Podcasts(logs, podcastdb)
+        podcasts.OPENAI_BATCH = True
+        podcasts.openai.OPENAI_BASE_URL = client.OPENAI_BASE_URL
+        (tmp_path / 'prompts.json').write_text(json.dumps({'default': {'role': 'role', 'pre_prompt': 'Summarize'}}), encoding='utf-8')
+        podcasts.prompts = Prompts(logs, tmp_path / 'prompts.json')
+
+        for number in (1, 2):
+            podcastdb.insert_podcast('category', 'test_summarize_batch', 'rss_feed', f'title {number}', f'test_summarize_batch_{number}', 'published', 'description')
+        for podcast in podcastdb.iter_podcasts():
+            podcast.downloaded = podcast.transcribed = 1
+            podcast.update_podcast()
+            with open(f'./{podcasts.FOLDER_PATH}/{podcasts.PREFIX}{podcast.id}.txt', 'w', encoding='utf-8') as text_file:
+                text_file.write(f'transcription {podcast.id}')
+
+        batch_id = f'batch_{time.time()}'
+        OpenAIStub.responses = [
+            (200, {'id': 'file_input', 'purpose': 'batch'}),
+            (200, {'id': batch_id, 'status': 'validating'}),
+        ]
+        assert podcasts.summarize_batch() == True
+        assert podcastdb.count_podcasts(summarized=(4,)) == 2
+
+        # next run: the batch is reconciled, a summary (4 > 1) and a failed request (4 > 2)
+        OpenAIStub.responses = [
+            (200, {'id': batch_id, 'status': 'completed', 'output_file_id': 'file_output'}),
+            (200, '\n'.join([
+                json.dumps({'custom_id': 'podcast-1', 'response': {'status_code': 200, 'body': {'choices': [{'message': {'role': 'assistant', 'content': 'batch summary'}}], 'usage': {'prompt_tokens': 30, 'completion_tokens': 12}}}}),
+                json.dumps({'custom_id': 'podcast-2', 'response': {'status_code': 400, 'body': {'error': {'message': 'bad request'}}}}),
+            ])),
+        ]
+        podcasts.reconcile_batches()
+        summarized = {podcast.id: podcast for podcast in podcastdb.iter_podcasts()}
+        assert (summarized[1].summarized, summarized[2].summarized) == (1, 2)
+        assert summarized[1].summary == 'batch summary'
+        assert summarized[1].summary_cost == pytest.approx(client.cost({'prompt_tokens': 30, 'completion_tokens': 12}, client.OPENAI_BATCH_PRICE_FACTOR))
+        assert not summarized[2].summary
+        assert batch_id not in podcastdb.openai_batches(client.BATCH_DONE)
+        assert OpenAIStub.responses == []
+        podcasts.close()
+        podcastdb.logout()
+    
+    else:
+        assert False
+
+
+def test_prompts(tmp_path):
+    if DEBUG == '4':
+        file_name = tmp_path / 'prompts.json'
+        file_name.write_text(json.dumps({
+            'default': {'role': 'default role', 'pre_prompt': 'Summarize $podcast_name'},
+            'podcasts': [
+                {'category': 'IA', 'role': 'expert', 'pre_prompt': '${title} ($published), $$5'},
+                {'category': 'unknown variable', 'pre_prompt': '$author, less than $5'},
+                {'category': 'no pre_prompt', 'pre_prompt': ''},
+            ]
+        }), encoding='utf-8')
+        prompts = Prompts(logs, file_name)
+        assert len(prompts) == 2
+
+        podcast = SimpleNamespace(category='IA', name='name', title='title', published='2025-01-01')
+        prompt = prompts.get(podcast)
+        assert prompt['role'] == 'expert'
+        assert prompt['pre_prompt'] == prompt['reduce_prompt'] == 'title (2025-01-01), $5'
+
+        podcast.category = 'other'
+        assert prompts.get(podcast)['pre_prompt'] == 'Summarize name'
+
+        # unknown variables and other $ kept in the prompt
+        podcast.category = 'unknown variable'
+        assert prompts.get(podcast)['pre_prompt'] == '$author, less than $5'
+
+        # invalid category: no fallback on the default prompt
+        podcast.category = 'no pre_prompt'
+        assert prompts.get(podcast) is None
+    
+    else:
+        assert False
@@ -1,9 +1,15 @@
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from email.utils import format_datetime
 import pytest
 import dotenv
 import os
+import threading
+import time
 from src.logs import Logs
 from src.utils_sqlite import PodcastDB
-from src.utils_parse_rss import ParseRSS
+from src.utils_http import HttpClient
+from src.utils_parse_rss import ParseRSS, ParsePodcast, LinkIndex, FeedStream, FeedScheduler
 
 
 dotenv.load_dotenv(override=True)
@@ -18,4 +24,337 @@ def test_parse_rss():
         assert parserss.podcasts == []
     
     else:
-        assert False
\ No newline at end of file
+        assert False
+
+def test_parse_feeds_report():
+    if DEBUG == '4':
+        parserss.feeds = [
+            {"category": "category", "name": "test_report_1", "rss_feed": "http://127.0.0.1:9/feed_1.xml"},
+            {"category": "category", "name": "test_report_2", "rss_feed": "http://127.0.0.1:9/feed_2.xml"}
+        ]
+        report = parserss.parse_feeds()
+        parserss.feeds = []
+
+        assert [feed['name'] for feed in report] == ['test_report_1', 'test_report_2']
+        assert all(feed['status'] == 'error' for feed in report)
+    
+    else:
+        assert False
+
+
+def test_parse_podcast_default_http():
+    if DEBUG == '4':
+        # without the client of ParseRSS: its own pooled client
+        parse_podcast = ParsePodcast(logs, podcastdb, 'category', 'test_parse_podcast_default_http', 'http://127.0.0.1:9/feed.xml')
+
+        assert isinstance(parse_podcast.http, HttpClient)
+        assert parse_podcast.report['status'] == 'error'
+        assert 'Failed to fetch RSS feed' in parse_podcast.report['error']
+    
+    else:
+        assert False
+
+
+class StubResponse():
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content
+        self.headers = headers or {}
+        self.chunks_read = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            self.chunks_read += 1
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession():
+    # feed server answering 304 to the conditional requests, or ignoring them (conditional=False)
+    def __init__(self, content, conditional=True):
+        self.content = content
+        self.conditional = conditional
+        self.requests = []
+        self.responses = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append(dict(headers or {}))
+        if self.conditional and (headers or {}).get('If-None-Match') == '"v1"':
+            response = StubResponse(304)
+        else:
+            response = StubResponse(200, self.content, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT', 'Content-Type': 'application/rss+xml'})
+        self.responses.append(response)
+        return response
+
+
+def test_conditional_get():
+    if DEBUG == '4':
+        content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>episode 1</title><link>https://example.com/test_conditional_get/1</link><enclosure url="https://cdn.example.com/test_conditional_get/1.mp3" type="audio/mpeg"/></item>
+</channel></rss>'''
+
+        for conditional, status in ((True, 'not_modified'), (False, 'unchanged')):
+            rss_feed = f'https://example.com/test_conditional_get_{status}.xml'
+            http = StubSession(content, conditional)
+
+            first = ParsePodcast(logs, podcastdb, 'category', 'test_conditional_get', rss_feed, http=http)
+            assert first.report['status'] == 'ok'
+            assert http.requests[0] == {}
+            assert podcastdb.feed_cache(rss_feed)['etag'] == '"v1"'
+
+            # second run: ETag / Last-Modified sent back, the feed is not parsed again
+            second = ParsePodcast(logs, podcastdb, 'category', 'test_conditional_get', rss_feed, http=http)
+            assert http.requests[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+            assert second.report['status'] == status
+            assert second.report['entries'] == 0
+    
+    else:
+        assert False
+
+
+def test_insert_quotes():
+    if DEBUG == '4':
+        content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>the "quoted" episode</title><link>https://example.com/test_insert_quotes?q="1"</link><description>&lt;p style="color: grey"&gt;description&lt;/p&gt;</description></item>
+</channel></rss>'''
+        ParsePodcast(logs, podcastdb, 'category', 'test_insert_quotes', 'https://example.com/test_insert_quotes.xml', http=StubSession(content))
+
+        # parameterized inserts: the values are saved as in the feed
+        podcast = next(podcast for podcast in podcastdb.iter_podcasts() if podcast.name == 'test_insert_quotes')
+        assert podcast.title == 'the "quoted" episode'
+        assert podcast.link == 'https://example.com/test_insert_quotes?q="1"'
+        assert '"' in podcast.description and "''" not in podcast.description
+    
+    else:
+        assert False
+
+
+def test_insert_failed(monkeypatch):
+    if DEBUG == '4':
+        content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>episode 1</title><link>http://127.0.0.1:9/test_insert_failed/1.mp3</link></item>
+</channel></rss>'''
+        rss_feed = 'https://example.com/test_insert_failed.xml'
+        http = StubSession(content)
+        link_index = LinkIndex(logs, podcastdb)
+
+        # database error: neither the validators of the feed nor the links of the index are saved
+        with monkeypatch.context() as patch:
+            patch.setattr(podcastdb, 'insert_podcasts', lambda podcasts: {'inserted': 0, 'skipped': 0, 'failed': len(podcasts)})
+            failed = ParsePodcast(logs, podcastdb, 'category', 'test_insert_failed', rss_feed, http=http, link_index=link_index)
+        assert failed.report['status'] == 'error'
+        assert failed.report['failed'] == 1
+        assert podcastdb.feed_cache(rss_feed).get('etag') is None
+        assert 'http://127.0.0.1:9/test_insert_failed/1.mp3' not in link_index
+
+        # next run: the feed is fetched and parsed again, its entry saved
+        saved = ParsePodcast(logs, podcastdb, 'category', 'test_insert_failed', rss_feed, http=http, link_index=link_index)
+        assert http.requests[1] == {}
+        assert (saved.report['status'], saved.report['inserted']) == ('ok', 1)
+        assert 'http://127.0.0.1:9/test_insert_failed/1.mp3' in link_index
+    
+    else:
+        assert False
+
+
+def test_iter_entries():
+    if DEBUG == '4':
+        content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>episode 2</title><link>https://example.com/2</link><pubDate>Tue, 02 Jan 2024 00:00:00 GMT</pubDate><enclosure url="https://cdn.example.com/2.mp3" type="audio/mpeg"/></item>
+<item><title>episode 1</title><link>https://example.com/1</link><description><![CDATA[<p>description</p>]]></description></item>
+</channel></rss>'''
+        entries = list(ParsePodcast.iter_entries(content))
+
+        assert [entry['title'] for entry in entries] == ['episode 2', 'episode 1']
+        assert entries[0]['enclosures'][0]['url'] == 'https://cdn.example.com/2.mp3'
+        assert entries[0]['published'] == 'Tue, 02 Jan 2024 00:00:00 GMT'
+        assert entries[1]['description'] == '<p>description</p>'
+
+        # known by the link of the page, stored by a previous run
+        assert ParsePodcast.is_known(entries[0], 'https://cdn.example.com/2.mp3', {'https://example.com/2'})
+        assert not ParsePodcast.is_known(entries[1], 'https://example.com/1', {'https://example.com/2'})
+    
+    else:
+        assert False
+
+
+def test_stream_early_stop(monkeypatch):
+    if DEBUG == '4':
+        monkeypatch.setenv('RSS_PARSER', 'stream')
+        monkeypatch.setenv('RSS_STOP_AFTER_KNOWN', '5')
+        monkeypatch.setattr(FeedStream, 'CHUNK_SIZE', 256)
+        # 40 entries of 2 kB: the parser reads the feed by blocks of 16 kB
+        items = ''.join(
+            f'<item><title>episode {number}</title><link>http://127.0.0.1:9/test_stream_early_stop/{number}.mp3</link><description>{"x" * 2048}</description></item>'
+            for number in range(40, 0, -1)
+        )
+        content = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>feed</title>{items}</channel></rss>'.encode('utf-8')
+        rss_feed = 'https://example.com/test_stream_early_stop.xml'
+        # server ignoring the conditional requests: the feed is sent again
+        http = StubSession(content, conditional=False)
+
+        first = ParsePodcast(logs, podcastdb, 'category', 'test_stream_early_stop', rss_feed, http=http)
+        assert first.report['inserted'] == 40
+        assert http.responses[0].closed
+        assert podcastdb.feed_cache(rss_feed)['content_hash'] is not None
+
+        # all the entries known: only the first chunks of the feed are read, then the connection is closed
+        second = ParsePodcast(logs, podcastdb, 'category', 'test_stream_early_stop', rss_feed, http=http)
+        assert second.report['status'] == 'ok'
+        assert second.report['known'] == 5
+        assert http.responses[1].closed
+        assert http.responses[1].chunks_read < len(content) // FeedStream.CHUNK_SIZE // 2
+        assert podcastdb.feed_cache(rss_feed)['etag'] == '"v1"'
+    
+    else:
+        assert False
+
+
+class StreamSession():
+    # feed server counting the responses not closed yet, by host and in all
+    def __init__(self, content):
+        self.content = content
+        self.lock = threading.Lock()
+        self.open = {}
+        self.max_open = {}
+        self.max_total = 0
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.open[host] = self.open.get(host, 0) + 1
+            self.max_open[host] = max(self.max_open.get(host, 0), self.open[host])
+            self.max_total = max(self.max_total, sum(self.open.values()))
+        time.sleep(0.01)
+        response = StubResponse(200, self.content, {'Content-Type': 'application/rss+xml'})
+        response.close = lambda: self.close(host)
+        return response
+
+    def close(self, host):
+        with self.lock:
+            self.open[host] -= 1
+
+
+def test_parallel_stream(monkeypatch):
+    if DEBUG == '4':
+        monkeypatch.setenv('RSS_PARSER', 'stream')
+        monkeypatch.setenv('RSS_WORKERS', '3')
+        monkeypatch.setenv('RSS_WORKERS_PER_HOST', '1')
+        content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>episode</title><link>http://127.0.0.1:9/test_parallel_stream.mp3</link></item>
+</channel></rss>'''
+        http = StreamSession(content)
+        stream_parserss = ParseRSS(logs, podcastdb, http)
+        stream_parserss.feeds = [
+            {"category": "category", "name": f"test_parallel_stream_{number}", "rss_feed": f"https://host{number % 2}.example.com/test_parallel_stream_{number}.xml"}
+            for number in range(8)
+        ]
+        report = stream_parserss.parse_feeds(force=True)
+
+        # the connection of a streamed feed counts for its host until the feed is parsed
+        assert [feed['status'] for feed in report] == ['ok'] * 8
+        assert http.max_open == {'host0.example.com': 1, 'host1.example.com': 1}
+        assert http.max_total <= 3
+        assert sum(http.open.values()) == 0
+    
+    else:
+        assert False
+
+
+def test_link_index(monkeypatch):
+    if DEBUG == '4':
+        podcastdb.insert_podcast('category', 'test_link_index', 'rss_feed', 'title', 'test_link_index', 'published', 'description')
+
+        for index_type in ('set', 'bloom'):
+            monkeypatch.setenv('LINK_INDEX', index_type)
+            link_index = LinkIndex(logs, podcastdb)
+
+            assert 'test_link_index' in link_index
+            assert 'test_link_index_new' not in link_index
+
+            stats = link_index.stats()
+            assert stats['size'] >= 1
+            assert stats['hits'] >= 1
+            assert 0.0 <= stats['false_positive_rate'] <= 1.0
+    
+    else:
+        assert False
+
+
+def test_feed_scheduler():
+    if DEBUG == '4':
+        scheduler = parserss.scheduler
+        rss_feed = 'test_feed_scheduler'
+        for day in (1, 8, 15, 22):
+            podcastdb.insert_podcast('category', 'test_feed_scheduler', rss_feed, 'title', f'test_feed_scheduler_{day}', f'Mon, {day:02d} Jan 2024 08:00:00 GMT', 'description')
+
+        # weekly show: a quarter of a week
+        assert scheduler.interval({'rss_feed': rss_feed}).total_seconds() == pytest.approx(7 * 24 * 3600 * scheduler.RSS_INTERVAL_FACTOR)
+        assert scheduler.interval({'rss_feed': rss_feed, 'interval_hours': 2}).total_seconds() == 2 * 3600
+
+        # never checked: due
+        assert scheduler.due([{'name': 'test_feed_scheduler', 'rss_feed': 'test_feed_scheduler_new'}]) == [{'name': 'test_feed_scheduler', 'rss_feed': 'test_feed_scheduler_new'}]
+        podcastdb.update_feed_cache(rss_feed)
+        assert scheduler.due([{'name': 'test_feed_scheduler', 'rss_feed': rss_feed}]) == []
+        assert scheduler.due([{'name': 'test_feed_scheduler', 'rss_feed': rss_feed, 'interval_hours': 0}]) != []
+    
+    else:
+        assert False
+
+
+def test_feed_scheduler_cadence(monkeypatch):
+    if DEBUG == '4':
+        monkeypatch.setenv('RSS_CADENCE_EPISODES', '5')
+        scheduler = FeedScheduler(logs, podcastdb)
+        rss_feed = 'test_feed_scheduler_cadence'
+        # back catalogue inserted newest first: 5 daily episodes, then 10 older monthly ones
+        dates = [datetime(2024, 6, day, 8, tzinfo=timezone.utc) for day in range(5, 0, -1)]
+        dates += [datetime(2023, month, 1, 8, tzinfo=timezone.utc) for month in range(12, 2, -1)]
+        for date in dates:
+            podcastdb.insert_podcast('category', 'test_feed_scheduler_cadence', rss_feed, 'title', f'test_feed_scheduler_cadence_{date:%Y%m%d}', format_datetime(date), 'description')
+
+        # cadence of the newest episodes, not of the last inserted
+        assert scheduler.interval({'rss_feed': rss_feed}).total_seconds() == pytest.approx(24 * 3600 * scheduler.RSS_INTERVAL_FACTOR)
+    
+    else:
+        assert False
+
+
+def test_sleep_time(monkeypatch):
+    if DEBUG == '4':
+        monkeypatch.setenv('RSS_MIN_INTERVAL_HOURS', '1')
+        monkeypatch.setenv('DAEMON_MIN_SLEEP_SECONDS', '60')
+        scheduler = FeedScheduler(logs, podcastdb)
+        rss_feed = 'test_sleep_time'
+        podcastdb.update_feed_cache(rss_feed)
+
+        # the earliest due time, even below the minimum interval
+        feeds = [{'name': 'test_sleep_time', 'rss_feed': rss_feed, 'interval_hours': 0.5}, {'name': 'test_sleep_time', 'rss_feed': rss_feed, 'interval_hours': 2}]
+        assert 1700 < scheduler.sleep_time(feeds) <= 1800
+        # due at once, before and after its check: the daemon does not loop without sleeping
+        feed = {'name': 'test_sleep_time', 'rss_feed': rss_feed, 'interval_hours': 0}
+        assert scheduler.sleep_time([feed]) == 60
+        assert scheduler.due([feed]) == [feed]
+        assert scheduler.sleep_time([feed]) == 60
+
+        # feed in error (never checked): its interval after the last attempt, not at once
+        feed = {'name': 'test_sleep_time', 'rss_feed': 'test_sleep_time_error'}
+        assert scheduler.sleep_time([feed]) == 60
+        assert scheduler.due([feed]) == [feed]
+        assert 3500 < scheduler.sleep_time([feed]) <= 3600
+        assert scheduler.due([feed]) == []
+    
+    else:
+        assert False
@@ -0,0 +1,151 @@
+import pytest
+import dotenv
+import os
+import threading
+import time
+from src.logs import Logs
+from src.utils_sqlite import PodcastDB
+from src.utils_podcast import Podcasts
+from src.utils_pipeline import Pipeline
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+logs = Logs()
+podcastdb = PodcastDB(logs)
+podcasts = Podcasts(logs, podcastdb)
+
+
+def test_pipeline():
+    if DEBUG == '4':
+        podcastdb.insert_podcast('category', 'test_pipeline', 'rss_feed', 'title', 'test_pipeline', 'published', 'description')
+        pipeline = Pipeline(logs, podcastdb, podcasts)
+
+        assert pipeline.run() == True
+        assert podcastdb.count_podcasts(downloaded=False) == 0
+        assert pipeline.download.succeeded + pipeline.download.failed >= 1
+    
+    else:
+        assert False
+
+
+class StubPodcast():
+    def __init__(self, id):
+        self.id = id
+
+    def update_podcast(self):
+        return True
+
+
+class StubPodcasts():
+    # stages recording their start and end times: fast downloads, slow transcriptions
+    DOWNLOAD_WORKERS = 2
+    DOWNLOAD_RETRY_FAILED = True
+    WHISPER_RETRY_FAILED = True
+    OPENAI_RETRY_FAILED = True
+    OPENAI_BATCH = False
+
+    def __init__(self, podcasts, failed=None):
+        self.podcasts = podcasts
+        self.failed = failed or {} # filters of the failed episodes to try again: episodes
+        self.lock = threading.Lock()
+        self.events = {'download': {}, 'transcribe': {}, 'summarize': {}}
+        self.max_waiting = 0
+
+    def bandwidth_limiter(self):
+        return None
+
+    def iter_podcasts(self, **filters):
+        if filters == {'downloaded': False}:
+            return iter(self.podcasts)
+        return iter(next((podcasts for failed, podcasts in self.failed.items() if dict(failed) == filters), []))
+
+    def run(self, stage, podcast, duration):
+        start = time.perf_counter()
+        time.sleep(duration)
+        with self.lock:
+            self.events[stage][podcast.id] = (start, time.perf_counter())
+            # downloaded episodes not taken by a transcription yet
+            self.max_waiting = max(self.max_waiting, len(self.events['download']) - len(self.events['transcribe']))
+        return True
+
+    def download_podcast(self, podcast, limiter=None):
+        return self.run('download', podcast, 0.005)
+
+    def transcribe_podcast(self, podcast):
+        return self.run('transcribe', podcast, 0.03)
+
+    def summarize_podcast(self, podcast):
+        return self.run('summarize', podcast, 0.005)
+
+    def summarize_batch(self):
+        # all the transcribed episodes at once, after the pipeline
+        with self.lock:
+            self.events['batch'] = (time.perf_counter(), set(self.events['transcribe']))
+        return True
+
+
+def test_pipeline_overlap(monkeypatch):
+    if DEBUG == '4':
+        monkeypatch.setenv('PIPELINE_QUEUE_SIZE', '1')
+        monkeypatch.setenv('PIPELINE_TRANSCRIBE_WORKERS', '1')
+        monkeypatch.setenv('PIPELINE_SUMMARIZE_WORKERS', '1')
+        stubs = StubPodcasts([StubPodcast(id) for id in range(12)])
+        pipeline = Pipeline(logs, podcastdb, stubs)
+
+        assert pipeline.run() == True
+
+        # every episode reaches the last stage
+        assert set(stubs.events['transcribe']) == set(range(12))
+        assert set(stubs.events['summarize']) == set(range(12))
+        assert (pipeline.download.succeeded, pipeline.transcribe.succeeded, pipeline.summarize.succeeded) == (12, 12, 12)
+
+        # overlap: the first transcription starts before the last download ends
+        assert min(start for start, _ in stubs.events['transcribe'].values()) < max(end for _, end in stubs.events['download'].values())
+
+        # back-pressure: the downloads wait for the transcriptions, at most the queue and one episode per download worker in advance
+        assert stubs.max_waiting <= pipeline.PIPELINE_QUEUE_SIZE + stubs.DOWNLOAD_WORKERS + pipeline.PIPELINE_TRANSCRIBE_WORKERS
+    
+    else:
+        assert False
+
+
+def test_pipeline_retry_failed():
+    if DEBUG == '4':
+        # failed downloads, transcriptions and summaries of the previous runs: fed to their stage again
+        failed = {
+            (('downloaded', (2, 3)),): [StubPodcast(100)],
+            (('downloaded', True), ('transcribed', (2, 3))): [StubPodcast(200)],
+            (('downloaded', True), ('transcribed', True), ('summarized', (2,))): [StubPodcast(300)],
+        }
+        stubs = StubPodcasts([StubPodcast(0)], failed)
+        assert Pipeline(logs, podcastdb, stubs).run() == True
+        assert set(stubs.events['download']) == {0, 100}
+        assert set(stubs.events['transcribe']) == {0, 100, 200}
+        assert set(stubs.events['summarize']) == {0, 100, 200, 300}
+
+        stubs = StubPodcasts([StubPodcast(0)], failed)
+        stubs.DOWNLOAD_RETRY_FAILED = stubs.WHISPER_RETRY_FAILED = stubs.OPENAI_RETRY_FAILED = False
+        assert Pipeline(logs, podcastdb, stubs).run() == True
+        assert set(stubs.events['summarize']) == {0}
+    
+    else:
+        assert False
+
+
+def test_pipeline_batch():
+    if DEBUG == '4':
+        stubs = StubPodcasts([StubPodcast(id) for id in range(4)])
+        stubs.OPENAI_BATCH = True
+        pipeline = Pipeline(logs, podcastdb, stubs)
+
+        # Batch API: no summary per episode, one batch submitted after the last transcription
+        assert pipeline.run() == True
+        assert pipeline.summarize is None
+        assert stubs.events['summarize'] == {}
+        submitted_at, transcribed = stubs.events['batch']
+        assert transcribed == set(range(4))
+        assert submitted_at >= max(end for _, end in stubs.events['transcribe'].values())
+    
+    else:
+        assert False
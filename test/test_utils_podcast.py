@@ -2,9 +2,13 @@ import pytest
 import dotenv
 import os
 import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from src.logs import Logs
 from src.utils_sqlite import PodcastDB
-from src.utils_podcast import Podcasts
+from src.utils_http import HttpClient
+from src.utils_podcast import Podcasts, Podcast, BandwidthLimiter
 
 
 if os.path.exists('./downloads/example.mp3'):
@@ -68,4 +72,214 @@ UPDATE podcasts
         assert count_before - 1 == count_after
     
     else:
-        assert False
\ No newline at end of file
+        assert False
+
+def test_update_podcast_dirty():
+    if DEBUG == '4':
+        podcastdb.insert_podcast('category', 'test_update_podcast_dirty', 'rss_feed', 'title "quoted"', 'test_update_podcast_dirty', 'published', 'description')
+        podcast = next(podcast for podcast in podcastdb.iter_podcasts() if podcast.link == 'test_update_podcast_dirty')
+        assert podcast.dirty == set()
+
+        podcast.downloaded = 1
+        podcast.title = 'title "quoted"'
+        assert podcast.dirty == {'downloaded'}
+        assert podcast.update_podcast() == True
+        assert podcast.dirty == set()
+        assert podcastdb.count_podcasts(downloaded=True) >= 1
+    
+    else:
+        assert False
+
+
+def test_media_url():
+    if DEBUG == '4':
+        podcastdb.insert_podcast('category', 'test_media_url', 'rss_feed', 'title', 'test_media_url', 'published', 'description')
+        podcast = next(podcast for podcast in podcastdb.iter_podcasts() if podcast.link == 'test_media_url')
+        assert podcast.media_url is None
+
+        # resolved audio file stored next to the link of the feed
+        podcast.media_url = 'https://cdn.example.com/test_media_url.mp3'
+        assert podcast.update_podcast() == True
+        podcast = next(podcast for podcast in podcastdb.iter_podcasts() if podcast.link == 'test_media_url')
+        assert podcast.media_url == 'https://cdn.example.com/test_media_url.mp3'
+    
+    else:
+        assert False
+
+
+AUDIO = bytes(range(256)) * 400
+
+
+class AudioHandler(BaseHTTPRequestHandler):
+    # audio file served with or without support of the Range requests (server.ranges)
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.ranges_received.append(self.headers.get('Range'))
+        start = 0
+        if self.server.ranges and self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(AUDIO) - 1}/{len(AUDIO)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(AUDIO) - start))
+        self.end_headers()
+        self.wfile.write(AUDIO[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_resume_download(tmp_path):
+    if DEBUG == '4':
+        server = ThreadingHTTPServer(('127.0.0.1', 0), AudioHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        http = HttpClient(logs)
+
+        try:
+            # the '.part' file of a previous run is resumed, or downloaded again when the server ignores the Range
+            for ranges, part in ((True, AUDIO[:1000]), (False, b'x' * 1000)):
+                server.ranges = ranges
+                server.ranges_received = []
+                file_name = str(tmp_path / f'test_resume_download_{ranges}.mp3')
+                with open(f'{file_name}.part', 'wb') as file:
+                    file.write(part)
+
+                podcast = Podcast(logs, podcastdb, 0, 'category', 'test_resume_download', 'rss_feed', 'title', 'link', 'published', 'description', 0, 0, 0, media_url=f'http://127.0.0.1:{server.server_port}/audio.mp3', http=http)
+                podcast.stream_to_file(file_name)
+
+                assert server.ranges_received == ['bytes=1000-']
+                with open(file_name, 'rb') as file:
+                    assert file.read() == AUDIO
+                assert not os.path.exists(f'{file_name}.part')
+                assert podcast.media_size == len(AUDIO)
+                assert podcast.media_type == 'audio/mpeg'
+
+        finally:
+            http.close()
+            server.shutdown()
+            server.server_close()
+    
+    else:
+        assert False
+
+
+class StubDownload():
+    # podcast whose download only sleeps, the downloads in flight are counted
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def __init__(self, id, host=None):
+        self.id = id
+        self.link = f'https://{host or f"host{id}"}.example.com/episode.mp3'
+        self.media_url = None
+        self.downloaded = 0
+        self.updated = False
+
+    def download_podcast(self, limiter=None):
+        with StubDownload.lock:
+            StubDownload.running += 1
+            StubDownload.max_running = max(StubDownload.max_running, StubDownload.running)
+        time.sleep(0.05)
+        with StubDownload.lock:
+            StubDownload.running -= 1
+        self.downloaded = 1
+
+    def update_podcast(self):
+        self.updated = True
+
+
+def test_parallel_downloads(monkeypatch):
+    if DEBUG == '4':
+        stubs = [StubDownload(id) for id in range(12)]
+        monkeypatch.setattr(podcasts, 'iter_podcasts', lambda **filters: iter(stubs) if filters == {'downloaded': False} else iter([]))
+        monkeypatch.setattr(podcasts, 'DOWNLOAD_WORKERS', 3)
+
+        assert podcasts.download_podcasts() == True
+        assert StubDownload.max_running == 3
+        assert all(stub.downloaded == 1 and stub.updated for stub in stubs)
+
+        # same host: DOWNLOAD_WORKERS_PER_HOST downloads at most
+        stubs = [StubDownload(id, 'test-parallel-downloads') for id in range(12)]
+        StubDownload.max_running = 0
+        monkeypatch.setattr(podcasts, 'DOWNLOAD_WORKERS_PER_HOST', 2)
+
+        assert podcasts.download_podcasts() == True
+        assert StubDownload.max_running == 2
+        assert all(stub.downloaded == 1 and stub.updated for stub in stubs)
+    
+    else:
+        assert False
+
+
+def test_bandwidth_limiter():
+    if DEBUG == '4':
+        # 100 kB/s: the first second is allowed at once, the next 50 kB wait 0.5s
+        limiter = BandwidthLimiter(100000)
+        start = time.monotonic()
+        for _ in range(15):
+            limiter.consume(10000)
+        elapsed = time.monotonic() - start
+
+        assert 0.45 <= elapsed < 1.5
+    
+    else:
+        assert False
+
+
+def test_map_reduce_workers(monkeypatch):
+    if DEBUG == '4':
+        lock = threading.Lock()
+        calls = {'running': 0, 'max_running': 0, 'chunks': 0}
+
+        def chat(role, prompt):
+            if prompt.startswith('chunk'):
+                with lock:
+                    calls['running'] += 1
+                    calls['max_running'] = max(calls['max_running'], calls['running'])
+                    calls['chunks'] += 1
+                time.sleep(0.02)
+                with lock:
+                    calls['running'] -= 1
+            return 'summary', {'prompt_tokens': 10, 'completion_tokens': 2}
+
+        monkeypatch.setattr(podcasts.openai, 'OPENAI_WORKERS', 2)
+        monkeypatch.setattr(podcasts.openai, 'chat', chat)
+        monkeypatch.setattr(podcasts.openai, 'split', lambda text, size: ['part'] * 4)
+        monkeypatch.setattr(podcasts, 'chunk_executor', None)
+
+        # 4 long episodes summarized at once: the chunk requests of all the episodes share OPENAI_WORKERS threads
+        prompt = {'role': 'role', 'chunk_prompt': 'chunk', 'reduce_prompt': 'reduce'}
+        results = []
+        threads = [threading.Thread(target=lambda id=id: results.append(podcasts.map_reduce(StubDownload(id), prompt, 'transcription'))) for id in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls['chunks'] == 16
+        assert calls['max_running'] == 2
+        assert results == [('summary', {'prompt_tokens': 50, 'completion_tokens': 10, 'cost': pytest.approx(podcasts.openai.cost({'prompt_tokens': 50, 'completion_tokens': 10}))})] * 4
+        podcasts.chunk_executor.shutdown()
+    
+    else:
+        assert False
+
+
+def test_save_summary_cached():
+    if DEBUG == '4':
+        podcast = StubDownload('test_save_summary_cached')
+        podcast.title = 'title'
+
+        podcasts.save_summary(podcast, 'summary', {'prompt_tokens': 1000, 'completion_tokens': 100})
+        assert podcast.summary_cost == podcasts.openai.cost({'prompt_tokens': 1000, 'completion_tokens': 100})
+
+        # answered by the summary cache: the tokens of the summary are kept, nothing was spent on this run
+        podcasts.save_summary(podcast, 'summary', {'prompt_tokens': 1000, 'completion_tokens': 100, 'cached': True})
+        assert (podcast.prompt_tokens, podcast.completion_tokens, podcast.summary_cost) == (1000, 100, 0.0)
+    
+    else:
+        assert False
@@ -0,0 +1,72 @@
+import pytest
+import dotenv
+import os
+from src.utils_resolvers import RESOLVERS, LinkResolver, AcastResolver, AushaResolver, AnchorResolver
+from src.utils_parse_rss import ParsePodcast
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+
+
+def test_resolver_dispatch():
+    if DEBUG == '4':
+        assert isinstance(RESOLVERS.resolver('https://feeds.acast.com/public/shows/show'), AcastResolver)
+        assert isinstance(RESOLVERS.resolver('https://sphinx.acast.com/p/open/s/show/e/episode/media.mp3'), AcastResolver)
+        assert isinstance(RESOLVERS.resolver('https://feed.ausha.co/show'), AushaResolver)
+        assert isinstance(RESOLVERS.resolver('https://anchor.fm/s/show/podcast/rss'), AnchorResolver)
+        assert type(RESOLVERS.resolver('https://example.com/feed.xml')) is LinkResolver
+        # not a parent domain
+        assert type(RESOLVERS.resolver('https://notacast.com/feed.xml')) is LinkResolver
+    
+    else:
+        assert False
+
+
+def test_feed_link():
+    if DEBUG == '4':
+        enclosure = {'url': 'https://cdn.example.com/episode.mp3', 'type': 'audio/mpeg'}
+        assert RESOLVERS.resolver('https://example.com/feed.xml').feed_link({'link': 'https://example.com/episode', 'enclosures': [enclosure]}) == enclosure['url']
+        assert RESOLVERS.resolver('https://example.com/feed.xml').feed_link({'link': 'https://example.com/episode'}) == 'https://example.com/episode'
+        assert RESOLVERS.resolver('https://example.com/feed.xml').feed_link({}) is None
+
+        acast = {'links': [{'href': 'https://shows.acast.com/show/episode'}, {'href': 'https://sphinx.acast.com/p/open/s/show/e/episode/media.mp3'}]}
+        assert RESOLVERS.resolver('https://feeds.acast.com/public/shows/show').feed_link(acast) == 'https://sphinx.acast.com/p/open/s/show/e/episode/media.mp3'
+
+        anchor = {'enclosures': [{'url': 'https://anchor.fm/s/show/podcast/play/episode', 'type': 'audio/x-m4a'}]}
+        assert RESOLVERS.resolver('https://anchor.fm/s/show/podcast/rss').feed_link(anchor) == 'https://anchor.fm/s/show/podcast/play/episode'
+    
+    else:
+        assert False
+
+
+def test_audio_links():
+    if DEBUG == '4':
+        def parse_page(tags):
+            raise AssertionError("a direct audio link is not fetched")
+
+        for link in ('https://sphinx.acast.com/p/open/s/show/e/episode/media.mp3', 'https://anchor.fm/s/show/podcast/play/episode', 'https://cdn.example.com/episode.m4a'):
+            assert RESOLVERS.resolver(link).audio_links(link, parse_page) == [link]
+    
+    else:
+        assert False
+
+
+def test_entry_links():
+    if DEBUG == '4':
+        # ausha: the runs before the resolvers stored the page of the episode, the resolver stores its audio file
+        entry = {
+            'link': 'https://podcast.ausha.co/show/episode',
+            'enclosures': [{'url': 'https://audio.ausha.co/episode.mp3', 'type': 'audio/mpeg'}],
+            'links': [{'href': 'https://podcast.ausha.co/show/episode'}, {'href': 'https://audio.ausha.co/episode.mp3'}]
+        }
+        resolver = RESOLVERS.resolver('https://feed.ausha.co/show')
+        link = resolver.feed_link(entry)
+
+        assert link == 'https://audio.ausha.co/episode.mp3'
+        assert resolver.entry_links(entry) == ['https://audio.ausha.co/episode.mp3', 'https://podcast.ausha.co/show/episode']
+        assert ParsePodcast.is_known(entry, link, {'https://podcast.ausha.co/show/episode'}, resolver)
+        assert not ParsePodcast.is_known(entry, link, {'https://podcast.ausha.co/show/other'}, resolver)
+    
+    else:
+        assert False
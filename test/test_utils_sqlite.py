@@ -1,6 +1,7 @@
 import pytest
 import dotenv
 import os
+import threading
 from src.logs import Logs
 from src.utils_sqlite import PodcastDB
 
@@ -60,4 +61,84 @@ UPDATE podcasts_not_exists
         assert return2 == False
     
     else:
-        assert False
\ No newline at end of file
+        assert False
+
+def test_insert_podcasts():
+    if DEBUG == '4':
+        podcasts = [
+            ('category', 'test_insert_podcasts', 'rss_feed', 'title', 'test_insert_podcasts 1', 'published', 'description'),
+            ('category', 'test_insert_podcasts', 'rss_feed', 'title', 'test_insert_podcasts 2', 'published', 'description'),
+            ('category', 'test_insert_podcasts', 'rss_feed', 'title', 'test_insert_podcasts 1', 'published', 'description')
+        ]
+        assert podcastdb.insert_podcasts(podcasts) == {'inserted': 2, 'skipped': 1, 'failed': 0}
+        assert podcastdb.insert_podcasts(podcasts) == {'inserted': 0, 'skipped': 3, 'failed': 0}
+
+        # error: the whole feed is reported as not saved
+        invalid = [('category', 'test_insert_podcasts', 'rss_feed', 'title', 'test_insert_podcasts 3', 'published', 'description'), ('category', 'test_insert_podcasts')]
+        assert podcastdb.insert_podcasts(invalid) == {'inserted': 0, 'skipped': 0, 'failed': 2}
+        assert 'test_insert_podcasts 3' not in podcastdb.feed_links('rss_feed')
+    
+    else:
+        assert False
+
+
+def test_migrations():
+    if DEBUG == '4':
+        podcastdb.cursor.execute("PRAGMA user_version")
+        assert podcastdb.cursor.fetchone()[0] == len(podcastdb.MIGRATIONS)
+
+        podcastdb.cursor.execute("EXPLAIN QUERY PLAN SELECT COUNT(1) FROM podcasts WHERE downloaded = 0")
+        assert 'podcasts_to_download' in podcastdb.cursor.fetchone()[3]
+        podcastdb.cursor.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(1) FROM podcasts{podcastdb.where(summarized=(4,))}")
+        assert 'podcasts_in_batch' in podcastdb.cursor.fetchone()[3]
+    
+    else:
+        assert False
+
+
+def test_migration_unescape():
+    if DEBUG == '4':
+        # row saved by the old f-string inserts: " escaped as ''
+        podcastdb.insert_podcast('category', 'test_migration_unescape', 'rss_feed', "the ''quoted'' title", "test_migration_unescape?q=''1''", 'published', "<p style=''color: grey''>")
+        with podcastdb.conn:
+            for request in podcastdb.MIGRATIONS[11]:
+                podcastdb.cursor.execute(request)
+
+        podcastdb.cursor.execute("SELECT title, link, description FROM podcasts WHERE podcast_name = 'test_migration_unescape'")
+        assert podcastdb.cursor.fetchone() == ('the "quoted" title', 'test_migration_unescape?q="1"', '<p style="color: grey">')
+    
+    else:
+        assert False
+
+
+def test_iter_podcasts():
+    if DEBUG == '4':
+        count = podcastdb.count_podcasts(downloaded=False)
+        assert sum(1 for _ in podcastdb.iter_podcasts(downloaded=False, batch_size=2)) == count
+    
+    else:
+        assert False
+
+
+def test_concurrent_writes():
+    if DEBUG == '4':
+        podcastdb.insert_podcasts([('category', 'test_concurrent_writes', 'rss_feed', 'title', f'test_concurrent_writes {i}', 'published', 'description') for i in range(8)])
+        ids = [podcast.id for podcast in podcastdb.iter_podcasts() if podcast.name == 'test_concurrent_writes']
+
+        # the threads of a stage share the connection through the lock, their commits grouped by batch()
+        def write(id):
+            with podcastdb.batch():
+                podcastdb.update_podcast_columns(id, {'summary': f'summary {id}'})
+
+        threads = [threading.Thread(target=write, args=(id,)) for id in ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert podcastdb.batch_depth == 0
+        podcastdb.cursor.execute("SELECT COUNT(1) FROM podcasts WHERE podcast_name = 'test_concurrent_writes' AND summary = 'summary ' || ID")
+        assert podcastdb.cursor.fetchone()[0] == 8
+    
+    else:
+        assert False
@@ -0,0 +1,79 @@
+import pytest
+import dotenv
+import os
+import threading
+import time
+from src.logs import Logs
+from src.utils_http import HttpClient
+from src.utils_whisper import WhisperDispatcher
+
+
+dotenv.load_dotenv(override=True)
+DEBUG = os.getenv("DEBUG")
+logs = Logs()
+whisper = WhisperDispatcher(logs, HttpClient(logs))
+
+
+def test_transcribe_no_backend():
+    if DEBUG == '4':
+        whisper.WHISPER_RETRIES = 0
+        whisper.backends = [{'url': 'http://127.0.0.1:9/transcribe/', 'in_flight': 0, 'jobs': 0}]
+
+        status, response_data = whisper.transcribe('test_transcribe_no_backend.mp3')
+        whisper.stop()
+
+        assert status == 3
+        assert 'error' in response_data
+        assert whisper.backends[0] == {'url': 'http://127.0.0.1:9/transcribe/', 'in_flight': 0, 'jobs': 1}
+    
+    else:
+        assert False
+
+
+class SlowBackend():
+    # Whisper API answering after its timeout, the requests in flight are counted
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.timeouts = []
+
+    def post(self, url, params=None, timeout=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.timeouts.append(timeout)
+        time.sleep(0.2)
+        with self.lock:
+            self.in_flight -= 1
+        raise TimeoutError('read timed out')
+
+
+def test_transcribe_timeout():
+    if DEBUG == '4':
+        backend = SlowBackend()
+        dispatcher = WhisperDispatcher(logs, backend)
+        dispatcher.WHISPER_TIMEOUT = 0.05
+        dispatcher.WHISPER_RETRIES = 1
+        dispatcher.WHISPER_RETRY_DELAY = 0
+
+        status, response_data = dispatcher.transcribe('test_transcribe_timeout.mp3')
+        dispatcher.stop()
+
+        # the retry waits for the end of the first request: never more jobs in flight than WHISPER_JOBS_PER_BACKEND
+        assert status == 3
+        assert backend.timeouts == [0.05, 0.05]
+        assert backend.max_in_flight == 1
+        assert dispatcher.backends[0]['in_flight'] == 0
+    
+    else:
+        assert False
+
+
+def test_stitch():
+    if DEBUG == '4':
+        texts = ['Hello and welcome to the show, today we talk', 'today we talk about podcasts.', 'Bye.']
+        assert WhisperDispatcher.stitch(texts) == 'Hello and welcome to the show, today we talk about podcasts. Bye.'
+    
+    else:
+        assert False